@@ -0,0 +1,125 @@
+from pathlib import Path
+
+# Output canvas per aspect ratio (matches the scale/pad chain in processor)
+PLAY_RES = {
+    "9:16": (720, 1280),
+    "16:9": (1280, 720),
+}
+
+def ass_color(rgba):
+    """Convert an (R, G, B, A) tuple to an ASS &HAABBGGRR colour"""
+    r, g, b = rgba[:3]
+    a = rgba[3] if len(rgba) > 3 else 255
+    return f"&H{255 - a:02X}{b:02X}{g:02X}{r:02X}"
+
+def ass_tag_color(rgba):
+    """Convert an (R, G, B, A) tuple to an override-tag &HBBGGRR& colour"""
+    r, g, b = rgba[:3]
+    return f"&H{b:02X}{g:02X}{r:02X}&"
+
+def ass_tag_alpha(rgba):
+    """Alpha of an (R, G, B, A) tuple as an override-tag &HAA& value"""
+    a = rgba[3] if len(rgba) > 3 else 255
+    return f"&H{255 - a:02X}&"
+
+def format_ass_time(seconds):
+    """Convert seconds to ASS H:MM:SS.cc"""
+    centis = int(round(max(seconds, 0.0) * 100))
+    hours, centis = divmod(centis, 360000)
+    minutes, centis = divmod(centis, 6000)
+    secs, centis = divmod(centis, 100)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{centis:02d}"
+
+def escape_ass_text(text):
+    """Keep caption words from being read as override blocks"""
+    return text.replace('\\', '/').replace('{', '(').replace('}', ')')
+
+def build_styles(style):
+    """ASS style lines for a template: caption text plus optional box"""
+    # Pillow draws the text 45px into a (130 + padding/2)px tall image whose
+    # bottom sits 100px above the frame edge; keep the baseline in that spot
+    total_height = 130 + (style["padding"] // 2)
+    margin_v = 100 + max(0, total_height - 45 - style["font_size"])
+    stroke_color = style.get("stroke_color", (0, 0, 0, 255))
+
+    fields = "Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding"
+    lines = [f"Format: {fields}"]
+    lines.append(
+        f"Style: Caption,Arial,{style['font_size']},{ass_color(style['text_color'])},"
+        f"{ass_color(style['highlight_color'])},{ass_color(stroke_color)},&HFF000000,"
+        f"-1,0,0,0,100,100,0,0,1,{style['stroke_width']},0,2,20,20,{margin_v},1"
+    )
+    if style["bg_color"][3] > 0:
+        # BorderStyle 3 draws an opaque box in OutlineColour; libass has no
+        # rounded corners so "radius" is not reproduced
+        lines.append(
+            f"Style: Box,Arial,{style['font_size']},&HFF000000,&HFF000000,"
+            f"{ass_color(style['bg_color'])},&HFF000000,"
+            f"-1,0,0,0,100,100,0,0,3,{style['padding'] // 2},0,2,20,20,{margin_v},1"
+        )
+    return lines
+
+def build_word_text(words, highlight_idx, style):
+    """Segment text with override tags on the highlighted word"""
+    parts = []
+    for i, word in enumerate(words):
+        text = escape_ass_text(word['word'])
+        if i == highlight_idx:
+            tags = f"\\c{ass_tag_color(style['highlight_color'])}\\1a{ass_tag_alpha(style['highlight_color'])}"
+            if style.get("has_glow", False):
+                glow_color = style.get("glow_color", style["highlight_color"])
+                tags += f"\\3c{ass_tag_color(glow_color)}\\3a{ass_tag_alpha(glow_color)}\\bord4\\blur6"
+            text = f"{{{tags}}}{text}{{\\r}}"
+        parts.append(text)
+    return ' '.join(parts)
+
+def box_dialogue(timeline, seg_idx, start, end):
+    """Background box event for a segment shown from start to end"""
+    plain_text = escape_ass_text(' '.join(w['word'] for w in timeline.segments[seg_idx]))
+    return f"Dialogue: 0,{format_ass_time(start)},{format_ass_time(end)},Box,,0,0,0,,{plain_text}"
+
+def create_ass_subtitles(timeline, output_path, template="classic", aspect_ratio="9:16"):
+    """Compile a caption timeline and a template into an ASS subtitle file"""
+    from processor import TEMPLATES
+
+    style = TEMPLATES.get(template, TEMPLATES["classic"])
+    play_x, play_y = PLAY_RES.get(aspect_ratio, PLAY_RES["16:9"])
+    has_box = style["bg_color"][3] > 0
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {play_x}",
+        f"PlayResY: {play_y}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        *build_styles(style),
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    event_count = 0
+    box = None  # (segment index, start, end) of the box being extended
+    for start, end, seg_idx, word_idx in timeline.events():
+        words = timeline.segments[seg_idx]
+        lines.append(
+            f"Dialogue: 1,{format_ass_time(start)},{format_ass_time(end)},Caption,,0,0,0,,"
+            f"{build_word_text(words, word_idx, style)}"
+        )
+        event_count += 1
+
+        # One box per unbroken run of a segment instead of one per word
+        if box is not None and box[0] == seg_idx and box[2] == start:
+            box = (seg_idx, box[1], end)
+            continue
+        if box is not None and has_box:
+            lines.append(box_dialogue(timeline, *box))
+        box = (seg_idx, start, end)
+    if box is not None and has_box:
+        lines.append(box_dialogue(timeline, *box))
+
+    Path(output_path).write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return {'path': str(output_path), 'events': event_count}
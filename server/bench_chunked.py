@@ -0,0 +1,98 @@
+"""Compare wall time of single-pass and chunked encoding on a synthetic video
+
+    python3 bench_chunked.py --seconds 600 --template neon
+"""
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import config
+from chunked import process_video_chunked
+from job_store import MemoryJobStore
+from processor import process_video
+
+def format_time(seconds):
+    """Seconds to the app's MM:SS:mmm caption format"""
+    millis = int(round(seconds * 1000))
+    return f"{millis // 60000:02d}:{millis // 1000 % 60:02d}:{millis % 1000:03d}"
+
+def make_synthetic_video(path, seconds, size="1280x720", rate=30):
+    """Test pattern video with a sine tone, generated by FFmpeg lavfi"""
+    subprocess.run([
+        'ffmpeg', '-v', 'error',
+        '-f', 'lavfi', '-i', f"testsrc2=size={size}:rate={rate}:duration={seconds}",
+        '-f', 'lavfi', '-i', f"sine=frequency=440:duration={seconds}",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-g', str(rate * 2),
+        '-c:a', 'aac', '-shortest', '-y', str(path),
+    ], check=True)
+
+def make_synthetic_captions(seconds, words_per_second=2.5, words_per_caption=4):
+    """Caption segments with evenly spaced words covering the whole video"""
+    word_length = 1.0 / words_per_second
+    captions = []
+    t = 0.0
+    index = 0
+    while t + word_length <= seconds:
+        words = []
+        for _ in range(words_per_caption):
+            if t + word_length > seconds:
+                break
+            words.append({"word": f"word{index}", "start": format_time(t), "end": format_time(t + word_length)})
+            t += word_length
+            index += 1
+        captions.append({
+            "text": ' '.join(w["word"] for w in words),
+            "start": words[0]["start"],
+            "end": words[-1]["end"],
+            "words": words,
+        })
+    return captions
+
+def run_once(process, source, captions, template, workdir, name):
+    """Run one pipeline on a private copy of the source; returns seconds"""
+    video_path = workdir / f"{name}_input.mp4"
+    shutil.copyfile(source, video_path)
+    store = MemoryJobStore()
+    store.create(name, {"status": "queued", "progress": 0})
+    started = time.perf_counter()
+    process(str(video_path), captions, "9:16", str(workdir / f"{name}.mp4"), name, store, template, ffmpeg_threads=config.CPU_COUNT)
+    elapsed = time.perf_counter() - started
+    job = store.get(name)
+    if job["status"] != "completed":
+        raise SystemExit(f"{name} failed: {job.get('error')}")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=300)
+    parser.add_argument('--template', default='classic')
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_chunked_"))
+    try:
+        source = workdir / "source.mp4"
+        make_synthetic_video(source, args.seconds)
+        captions = make_synthetic_captions(args.seconds)
+
+        single = run_once(process_video, source, captions, args.template, workdir, "single")
+        chunked = run_once(process_video_chunked, source, captions, args.template, workdir, "chunked")
+
+        print(json.dumps({
+            "seconds": args.seconds,
+            "template": args.template,
+            "cpu_count": config.CPU_COUNT,
+            "chunk_seconds": config.CHUNK_SECONDS,
+            "chunk_parallelism": config.CHUNK_PARALLELISM,
+            "single_pass_wall": round(single, 2),
+            "chunked_wall": round(chunked, 2),
+            "speedup": round(single / chunked, 2),
+        }, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
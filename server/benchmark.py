@@ -0,0 +1,171 @@
+"""Benchmark the render pipeline for every template on a synthetic video
+
+    python3 benchmark.py --seconds 60 --save baseline.json
+    python3 benchmark.py --seconds 60 --baseline baseline.json
+
+Runs offline (no server, no sample video): FFmpeg generates the source and
+captions are synthesized at the requested words per second. Results are
+printed as JSON; with --baseline each metric is compared against an
+earlier run and the exit status is 1 if anything got slower or bigger
+than the tolerance allows.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import config
+from bench_chunked import make_synthetic_captions, make_synthetic_video
+from job_store import MemoryJobStore
+from metrics import files_bytes
+from processor import TEMPLATES, create_caption_images_with_template, process_video
+from timeline import compile_timeline
+
+# Compared against the baseline; lower is better for all of them
+COMPARED_METRICS = ("rasterize_seconds", "encode_seconds", "peak_rss_mb", "output_bytes")
+
+def peak_rss_mb(who):
+    """Peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(who).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def ffmpeg_version():
+    try:
+        result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.splitlines()[0] if result.stdout else None
+
+def measure_template(source, captions, template, workdir, engine, render_mode):
+    """Rasterize and encode one template; runs in its own process so peak RSS is its own"""
+    timeline = compile_timeline(captions)
+
+    # Rasterization alone, the way the legacy overlay path writes frames
+    frames_dir = workdir / f"{template}_frames"
+    frames_dir.mkdir()
+    started = time.perf_counter()
+    overlay_data = create_caption_images_with_template(timeline, frames_dir, template)
+    rasterize_seconds = time.perf_counter() - started
+    overlay_bytes = files_bytes(overlay['path'] for overlay in overlay_data)
+    shutil.rmtree(frames_dir)
+
+    # The full pipeline on a private copy (process_video deletes its input)
+    video_path = workdir / f"{template}_input.mp4"
+    output_path = workdir / f"{template}.mp4"
+    shutil.copyfile(source, video_path)
+    store = MemoryJobStore()
+    store.create(template, {"status": "queued", "progress": 0})
+    started = time.perf_counter()
+    process_video(
+        str(video_path), captions, "9:16", str(output_path), template, store, template,
+        render_mode, engine, ffmpeg_threads=config.CPU_COUNT
+    )
+    encode_seconds = time.perf_counter() - started
+    job = store.get(template)
+    if job["status"] != "completed":
+        raise RuntimeError(f"{template} failed: {job.get('error')}")
+    output_bytes = output_path.stat().st_size
+    output_path.unlink()
+
+    return {
+        "rasterize_seconds": round(rasterize_seconds, 3),
+        "overlay_count": len(overlay_data),
+        "overlay_bytes": overlay_bytes,
+        "encode_seconds": round(encode_seconds, 3),
+        "stages": job.get("timings", {}),
+        "peak_rss_mb": peak_rss_mb(resource.RUSAGE_SELF),
+        "ffmpeg_peak_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        "output_bytes": output_bytes,
+    }
+
+def compare(results, baseline, tolerance):
+    """Per template and metric: baseline, current, change in percent and whether it regressed"""
+    comparison = {}
+    for template, current in results["templates"].items():
+        previous = baseline.get("templates", {}).get(template)
+        if previous is None:
+            continue
+        comparison[template] = {}
+        for metric in COMPARED_METRICS:
+            if metric not in previous:
+                continue
+            before, after = previous[metric], current[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            comparison[template][metric] = {
+                "baseline": before,
+                "current": after,
+                "change_pct": round(change, 1),
+                "regression": change > tolerance,
+            }
+    return comparison
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=60)
+    parser.add_argument('--words-per-second', type=float, default=2.5)
+    parser.add_argument('--words-per-caption', type=int, default=4)
+    parser.add_argument('--size', default='1280x720', help="source frame size")
+    parser.add_argument('--templates', default=','.join(TEMPLATES), help="comma separated")
+    parser.add_argument('--engine', default='pillow', choices=['pillow', 'ass'])
+    parser.add_argument('--render-mode', default='track', choices=['track', 'overlays'])
+    parser.add_argument('--save', help="also write the results to this file")
+    parser.add_argument('--baseline', help="results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=10.0, help="allowed increase in percent")
+    args = parser.parse_args()
+
+    templates = [t.strip() for t in args.templates.split(',') if t.strip()]
+    unknown = [t for t in templates if t not in TEMPLATES]
+    if unknown:
+        raise SystemExit(f"Unknown templates: {', '.join(unknown)}")
+
+    workdir = Path(tempfile.mkdtemp(prefix="benchmark_"))
+    try:
+        source = workdir / "source.mp4"
+        make_synthetic_video(source, args.seconds, args.size)
+        captions = make_synthetic_captions(args.seconds, args.words_per_second, args.words_per_caption)
+
+        results = {
+            "seconds": args.seconds,
+            "words_per_second": args.words_per_second,
+            "words": sum(len(caption["words"]) for caption in captions),
+            "size": args.size,
+            "engine": args.engine,
+            "render_mode": args.render_mode,
+            "cpu_count": config.CPU_COUNT,
+            "ffmpeg": ffmpeg_version(),
+            "templates": {},
+        }
+        # A fresh process per template keeps peak RSS and font caches separate
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(1, maxtasksperchild=1) as pool:
+            for template in templates:
+                results["templates"][template] = pool.apply(
+                    measure_template,
+                    (source, captions, template, workdir, args.engine, args.render_mode)
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2) + "\n")
+
+    regressed = False
+    if args.baseline:
+        comparison = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        results["comparison"] = comparison
+        regressed = any(
+            entry["regression"] for metrics in comparison.values() for entry in metrics.values()
+        )
+
+    print(json.dumps(results, indent=2))
+    if regressed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
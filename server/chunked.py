@@ -0,0 +1,194 @@
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+import config
+from ffmpeg_runner import run_ffmpeg, run_ffmpeg_async
+from metrics import JobTimings, record_captions
+from planner import audio_encode_args, container_args, plan_job, video_encode_args
+from probe import probe_keyframes, probe_media
+from timeline import compile_timeline
+from processor import (
+    TEMPLATES, caption_track_files, check_ffmpeg_result, create_ass_subtitles,
+    create_caption_track, parse_ffmpeg_progress, record_failure, remux_faststart,
+    report_encode_progress, thread_args, write_caption_track_list,
+)
+
+def plan_chunks(duration, keyframes, chunk_seconds):
+    """Split [0, duration) at keyframes into pieces of about chunk_seconds"""
+    boundaries = [0.0]
+    for keyframe in keyframes:
+        # Keep the last piece from ending up tiny
+        if keyframe - boundaries[-1] >= chunk_seconds and duration - keyframe >= chunk_seconds / 2:
+            boundaries.append(keyframe)
+    boundaries.append(duration)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def build_chunk_command(video_path, start, end, base_filter, track_list=None, subtitles=None, decode_threads=None):
+    """Render one time slice of the video (no audio) with its captions"""
+    # Input seeking lands on the keyframe at start, so no frames are dropped
+    ffmpeg_cmd = ['ffmpeg']
+    if decode_threads:
+        ffmpeg_cmd.extend(['-threads', str(decode_threads)])
+    ffmpeg_cmd.extend(['-ss', f"{start:.3f}", '-t', f"{end - start:.3f}", '-i', video_path])
+
+    if subtitles is not None:
+        # Shift timestamps back to source time for libass, then rebase to 0
+        filter_complex = (
+            f"[0:v]{base_filter},setpts=PTS+{start:.3f}/TB,"
+            f"ass=filename={subtitles['path']},setpts=PTS-STARTPTS[out]"
+        )
+    elif track_list is not None:
+        ffmpeg_cmd.extend(['-f', 'concat', '-safe', '0', '-i', track_list])
+        filter_complex = (
+            f"[0:v]{base_filter}[base];"
+            f"[base][1:v]overlay=(main_w-overlay_w)/2:main_h-overlay_h-100:eof_action=pass[out]"
+        )
+    else:
+        filter_complex = f"[0:v]{base_filter}[out]"
+
+    ffmpeg_cmd.extend(['-filter_complex', filter_complex, '-map', '[out]', '-an'])
+    return ffmpeg_cmd
+
+def build_stitch_command(video_path, chunk_list, output_path, audio_args=('-c:a', 'copy'), trim_seconds=None, mp4_args=()):
+    """Join encoded chunks without re-encoding and add the source audio once"""
+    ffmpeg_cmd = [
+        'ffmpeg', '-f', 'concat', '-safe', '0', '-i', chunk_list,
+        '-i', video_path,
+        '-map', '0:v', '-map', '1:a?',
+        '-c:v', 'copy', *audio_args, *mp4_args,
+    ]
+    if trim_seconds is not None:
+        ffmpeg_cmd.extend(['-t', f"{trim_seconds:.3f}"])
+    ffmpeg_cmd.extend(['-y', output_path])
+    return ffmpeg_cmd
+
+def process_video_chunked(video_path, captions, aspect_ratio, output_path, job_id, store, template="classic", render_mode="track", engine="pillow", ffmpeg_threads=None, on_spawn=None, media=None, queue_depth=0, is_cancelled=None):
+    """Process a long video as keyframe-aligned chunks encoded in parallel
+
+    Captions are rendered once; each chunk overlays only the caption frames
+    visible in its window (times rebased to the chunk), chunks are encoded
+    concurrently and then stitched with the concat demuxer.
+    """
+    try:
+        store.update(job_id, status="processing", progress=10)
+
+        # Chunk encodes stay on disk; captions may go to a tmpfs scratch dir
+        temp_dir = Path(config.TEMP_DIR) / job_id
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        caption_dir = Path(config.SCRATCH_DIR) / job_id
+        caption_dir.mkdir(parents=True, exist_ok=True)
+
+        plan = plan_job(media or probe_media(video_path), [aspect_ratio], queue_depth, ffmpeg_threads)
+        store.update(job_id, plan=plan)
+        duration = plan['duration']
+        if duration is None:
+            raise Exception("Could not read the video duration")
+        chunks = plan_chunks(duration, probe_keyframes(video_path), config.CHUNK_SECONDS)
+
+        base_filter = plan['filters'][aspect_ratio]
+        timeline = compile_timeline(captions)
+        timings = JobTimings(store, [job_id])
+
+        # Create captions once for the whole video
+        store.update(job_id, progress=30)
+        track = subtitles = None
+        with timings.stage("rasterize") as stage:
+            if engine == "ass":
+                subtitles = create_ass_subtitles(timeline, caption_dir / "captions.ass", template, aspect_ratio)
+                record_captions(stage, [subtitles['path']], images=0)
+            else:
+                track = create_caption_track(timeline, caption_dir, template)
+                record_captions(stage, caption_track_files(track), images=track['frames'] if track else 0)
+
+        # Split the job's thread budget between the chunks encoding at once
+        parallelism = max(1, min(len(chunks), config.CHUNK_PARALLELISM))
+        chunk_threads = max(1, (plan['encode_threads'] or config.CPU_COUNT) // parallelism)
+        decode_threads = min(plan['decode_threads'] or chunk_threads, chunk_threads)
+
+        commands = []
+        chunk_paths = []
+        with timings.stage("graph"):
+            for i, (start, end) in enumerate(chunks):
+                track_list = None
+                if track is not None:
+                    track_list = write_caption_track_list(track, caption_dir / f"chunk_{i}.ffconcat", start, end)
+                chunk_path = temp_dir / f"chunk_{i}.mp4"
+                chunk_paths.append(chunk_path)
+                ffmpeg_cmd = build_chunk_command(video_path, start, end, base_filter, track_list, subtitles, decode_threads)
+                ffmpeg_cmd.extend([*video_encode_args(plan), *thread_args(chunk_threads), '-y', str(chunk_path)])
+                commands.append(ffmpeg_cmd)
+
+        print(f"Processing with template: {TEMPLATES.get(template, TEMPLATES['classic'])['name']}")
+        print(f"Encoding {len(chunks)} chunks, {parallelism} at a time ({chunk_threads} threads each)")
+
+        store.update(job_id, progress=50)
+        # Progress is the encoded time summed over chunks; fps and speed add up
+        chunk_progress = {}
+        # CPU time of every chunk encode plus the stitch
+        cpu_seconds = []
+
+        async def encode_chunk(index, ffmpeg_cmd, slots):
+            def on_progress(block):
+                encoded, fps, speed = parse_ffmpeg_progress(block)
+                if encoded is None:
+                    return
+                chunk_progress[index] = (encoded, fps or 0.0, speed or 0.0)
+                totals = [sum(values) for values in zip(*chunk_progress.values())]
+                report_encode_progress(store, job_id, duration, *totals)
+
+            async with slots:
+                result = await run_ffmpeg_async(ffmpeg_cmd, on_spawn, on_progress)
+            cpu_seconds.append(result.cpu_seconds)
+            check_ffmpeg_result(result, store, [job_id])
+
+        async def encode_chunks():
+            # All chunk encodes share one event loop, parallelism at a time
+            slots = asyncio.Semaphore(parallelism)
+            tasks = [asyncio.ensure_future(encode_chunk(i, cmd, slots)) for i, cmd in enumerate(commands)]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # One chunk failed: cancelling the rest kills their FFmpeg
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+        with timings.stage("ffmpeg") as stage:
+            stage['chunks'] = len(chunks)
+            asyncio.run(encode_chunks())
+
+            # Stitch
+            chunk_list = temp_dir / "chunks.ffconcat"
+            chunk_list.write_text(
+                "ffconcat version 1.0\n" + "".join(f"file '{path.resolve()}'\n" for path in chunk_paths)
+            )
+            stitch_cmd = build_stitch_command(
+                video_path, str(chunk_list), output_path, audio_encode_args(plan), plan['trim_seconds'],
+                container_args(plan)
+            )
+            result = run_ffmpeg(stitch_cmd, on_spawn)
+            cpu_seconds.append(result.cpu_seconds)
+            check_ffmpeg_result(result, store, [job_id])
+            if None not in cpu_seconds:
+                stage['cpu_seconds'] = round(sum(cpu_seconds), 3)
+        if plan['container'] == "fragmented":
+            with timings.stage("remux") as stage:
+                stage['cpu_seconds'] = remux_faststart([output_path], store, [job_id], on_spawn)
+
+        # Cleanup
+        with timings.stage("cleanup"):
+            shutil.rmtree(temp_dir)
+            shutil.rmtree(caption_dir, ignore_errors=True)
+            os.remove(video_path)
+
+        store.update(job_id, status="completed", progress=100, eta_seconds=0)
+
+    except Exception as e:
+        if record_failure(store, [job_id], e, is_cancelled):
+            return
+        print(f"Error processing video: {e}")
+        import traceback
+        traceback.print_exc()
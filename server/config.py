@@ -0,0 +1,90 @@
+import os
+
+def env_int(name, default):
+    """Read an integer setting from the environment"""
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Job scheduling: how many videos encode at once and how many threads each
+# FFmpeg process may use (defaults split the machine evenly between workers)
+MAX_WORKERS = env_int("AUTOCAPTION_MAX_WORKERS", max(1, CPU_COUNT // 4))
+FFMPEG_THREADS = env_int("AUTOCAPTION_FFMPEG_THREADS", max(1, CPU_COUNT // MAX_WORKERS))
+
+# Job store: SQLite database shared by every server process ("" = in-memory)
+JOB_DB = os.environ.get("AUTOCAPTION_JOB_DB", "jobs.db")
+
+# Uploads: streamed to disk in chunks; larger or longer videos are rejected
+MAX_UPLOAD_BYTES = env_int("AUTOCAPTION_MAX_UPLOAD_MB", 500) * 1024 * 1024
+MAX_VIDEO_SECONDS = env_int("AUTOCAPTION_MAX_VIDEO_SECONDS", 600)
+UPLOAD_CHUNK_BYTES = env_int("AUTOCAPTION_UPLOAD_CHUNK_KB", 1024) * 1024
+
+# Pipeline planning: sources above MAX_SOURCE_PIXELS are rejected; with
+# TRIM_LONG_VIDEOS, videos over MAX_VIDEO_SECONDS are cut instead of rejected.
+# Videos longer than LONG_VIDEO_SECONDS get a faster x264 preset.
+MAX_SOURCE_PIXELS = env_int("AUTOCAPTION_MAX_SOURCE_PIXELS", 3840 * 2160)
+TRIM_LONG_VIDEOS = bool(env_int("AUTOCAPTION_TRIM_LONG_VIDEOS", 0))
+LONG_VIDEO_SECONDS = env_int("AUTOCAPTION_LONG_VIDEO_SECONDS", 180)
+
+# Render cache: finished outputs keyed by video hash + captions + template
+CACHE_DIR = os.environ.get("AUTOCAPTION_CACHE_DIR", "cache")
+CACHE_MAX_BYTES = env_int("AUTOCAPTION_CACHE_MB", 5120) * 1024 * 1024
+
+# Output MP4 layout: "fragmented" plays (and /stream serves it) while it is
+# being encoded, then is remuxed into a faststart MP4 for download;
+# "faststart" writes the classic MP4 directly (no /stream)
+OUTPUT_CONTAINER = os.environ.get("AUTOCAPTION_OUTPUT_CONTAINER", "fragmented")
+
+# Behind nginx, set to an internal location aliased to the outputs directory
+# (e.g. "/protected/outputs/") and downloads are handed off with
+# X-Accel-Redirect, so nginx serves them with sendfile, ranges and caching
+DOWNLOAD_ACCEL_REDIRECT = os.environ.get("AUTOCAPTION_DOWNLOAD_ACCEL_REDIRECT", "")
+
+# Caption timeline: gaps between words up to CAPTION_GAP_BRIDGE_MS are
+# closed, words shorter than CAPTION_MIN_WORD_MS get no highlight of their own
+CAPTION_GAP_BRIDGE_MS = env_int("AUTOCAPTION_CAPTION_GAP_BRIDGE_MS", 500)
+CAPTION_MIN_WORD_MS = env_int("AUTOCAPTION_CAPTION_MIN_WORD_MS", 40)
+
+# Source videos kept by content hash so /preview can reuse an upload
+SOURCE_DIR = os.environ.get("AUTOCAPTION_SOURCE_DIR", "sources")
+PREVIEW_TIMEOUT_SECONDS = env_int("AUTOCAPTION_PREVIEW_TIMEOUT_SECONDS", 10)
+
+# Chunked encoding: videos at least this long (seconds, 0 = never) are split
+# at keyframes into ~CHUNK_SECONDS pieces encoded CHUNK_PARALLELISM at a time
+CHUNKED_MIN_SECONDS = env_int("AUTOCAPTION_CHUNKED_MIN_SECONDS", 120)
+CHUNK_SECONDS = env_int("AUTOCAPTION_CHUNK_SECONDS", 30)
+CHUNK_PARALLELISM = env_int("AUTOCAPTION_CHUNK_PARALLELISM", max(2, CPU_COUNT // 4))
+
+# Font registry: text measurements cached per (font, size, text) per process
+FONT_METRICS_CACHE_SIZE = env_int("AUTOCAPTION_FONT_METRICS_CACHE", 20000)
+
+# Working files: chunk encodes go to TEMP_DIR, caption rasters and subtitle
+# files to SCRATCH_DIR (point it at a tmpfs such as /dev/shm/autocaption to
+# keep them off the disk)
+TEMP_DIR = os.environ.get("AUTOCAPTION_TEMP_DIR", "temp")
+SCRATCH_DIR = os.environ.get("AUTOCAPTION_SCRATCH_DIR", TEMP_DIR)
+
+# Janitor: every JANITOR_INTERVAL_SECONDS, files older than their directory's
+# TTL (hours, 0 = keep) are removed, then least recently downloaded outputs
+# are evicted while everything together is over DISK_QUOTA_MB (0 = no quota)
+JANITOR_INTERVAL_SECONDS = env_int("AUTOCAPTION_JANITOR_INTERVAL_SECONDS", 600)
+UPLOAD_TTL_HOURS = env_int("AUTOCAPTION_UPLOAD_TTL_HOURS", 24)
+TEMP_TTL_HOURS = env_int("AUTOCAPTION_TEMP_TTL_HOURS", 6)
+OUTPUT_TTL_HOURS = env_int("AUTOCAPTION_OUTPUT_TTL_HOURS", 72)
+SOURCE_TTL_HOURS = env_int("AUTOCAPTION_SOURCE_TTL_HOURS", 24)
+DISK_QUOTA_BYTES = env_int("AUTOCAPTION_DISK_QUOTA_MB", 0) * 1024 * 1024
+
+# Debugging: with PROFILE_JOBS on, /upload accepts profile=true and dumps a
+# cProfile of the job's Python side to PROFILE_DIR/{job_id}.prof
+PROFILE_JOBS = bool(env_int("AUTOCAPTION_PROFILE_JOBS", 0))
+PROFILE_DIR = os.environ.get("AUTOCAPTION_PROFILE_DIR", "profiles")
+
+# FFmpeg watchdogs and limits: a run is killed after FFMPEG_TIMEOUT_SECONDS,
+# or after FFMPEG_STALL_SECONDS without progress. Encodes run at nice
+# FFMPEG_NICE, optionally capped in address space (MB) and CPU seconds (0 = no cap)
+FFMPEG_TIMEOUT_SECONDS = env_int("AUTOCAPTION_FFMPEG_TIMEOUT_SECONDS", 3600)
+FFMPEG_STALL_SECONDS = env_int("AUTOCAPTION_FFMPEG_STALL_SECONDS", 120)
+FFMPEG_NICE = env_int("AUTOCAPTION_FFMPEG_NICE", 10)
+FFMPEG_MAX_MEMORY_MB = env_int("AUTOCAPTION_FFMPEG_MAX_MEMORY_MB", 0)
+FFMPEG_MAX_CPU_SECONDS = env_int("AUTOCAPTION_FFMPEG_MAX_CPU_SECONDS", 0)
@@ -0,0 +1,82 @@
+import asyncio
+import re
+from email.utils import parsedate_to_datetime
+
+from fastapi.responses import FileResponse
+
+class WholeFileResponse(FileResponse):
+    """FileResponse that always sends the whole file
+
+    /download answers Range requests itself; newer Starlette versions would
+    otherwise apply a Range header we decided to ignore (a multipart or
+    reversed range, or a stale If-Range) and answer 206/416 anyway.
+    """
+
+    async def __call__(self, scope, receive, send):
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"range", b"if-range")]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+def not_modified(request, response):
+    """Whether the client's cached copy (If-None-Match / If-Modified-Since) is still current"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or response.headers["etag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(if_modified_since) >= parsedate_to_datetime(response.headers["last-modified"])
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_byte_range(range_header, size):
+    """(first, last) byte of a single "bytes=" range; None sends the whole file
+    
+    Multipart and malformed ranges are ignored, as RFC 9110 allows. Raises
+    ValueError when the range can't be satisfied (416).
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", range_header)
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - int(last), 0), size - 1
+    first = int(first)
+    if first >= size:
+        raise ValueError("unsatisfiable range")
+    last = min(int(last), size - 1) if last else size - 1
+    if last < first:
+        return None
+    return first, last
+
+def if_range_matches(request, response):
+    """Whether a Range request's If-Range (an ETag or date) still names this file"""
+    if_range = request.headers.get("if-range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        # Strong comparison: a weak tag never matches
+        return if_range == response.headers["etag"]
+    try:
+        return parsedate_to_datetime(if_range) == parsedate_to_datetime(response.headers["last-modified"])
+    except (TypeError, ValueError):
+        return False
+
+async def read_file_range(path, first, last, chunk_size):
+    """Bytes first..last (inclusive) of a file, read in chunks off the event loop"""
+    with open(path, "rb") as handle:
+        handle.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(handle.read, min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from fonts import FONTS
+
+# Gaussian radius of the highlight glow; ink spreads about 3 radii
+GLOW_RADIUS = 4
+GLOW_SPREAD = GLOW_RADIUS * 3
+
+def draw_stroked_text(draw, xy, text, font, fill, stroke_width=0, stroke_fill=None):
+    """Draw text with Pillow's native stroke in a single call"""
+    if stroke_width > 0:
+        draw.text(xy, text, font=font, fill=fill, stroke_width=stroke_width, stroke_fill=stroke_fill)
+    else:
+        draw.text(xy, text, font=font, fill=fill)
+
+def draw_glow(img, xy, text, font, glow_color, radius=GLOW_RADIUS):
+    """Composite a blurred glow of text onto img in place"""
+    # Rasterize the text once into an alpha mask sized to the glyphs plus blur
+    bbox = FONTS.bbox(font, text)
+    bbox = (bbox[0] + xy[0], bbox[1] + xy[1], bbox[2] + xy[0], bbox[3] + xy[1])
+    pad = radius * 3
+    left, top = int(bbox[0]) - pad, int(bbox[1]) - pad
+    mask = Image.new('L', (int(bbox[2]) - left + pad, int(bbox[3]) - top + pad), 0)
+    ImageDraw.Draw(mask).text((xy[0] - left, xy[1] - top), text, font=font, fill=255)
+    mask = mask.filter(ImageFilter.GaussianBlur(radius))
+    composite_color_mask(img, glow_color, mask, (left, top))
+
+def composite_color_mask(img, color, mask, dest):
+    """Source-over composite a solid RGBA colour through an L mask"""
+    x0, y0 = max(dest[0], 0), max(dest[1], 0)
+    x1 = min(dest[0] + mask.width, img.width)
+    y1 = min(dest[1] + mask.height, img.height)
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    # Build a straight-alpha colour layer in NumPy (integer math only)
+    coverage = np.asarray(mask, dtype=np.uint16)[y0 - dest[1]:y1 - dest[1], x0 - dest[0]:x1 - dest[0]]
+    layer = np.empty(coverage.shape + (4,), dtype=np.uint8)
+    layer[..., :3] = color[:3]
+    layer[..., 3] = (coverage * color[3] + 127) // 255
+
+    img.alpha_composite(Image.fromarray(layer, 'RGBA'), (x0, y0))
@@ -0,0 +1,248 @@
+import asyncio
+import os
+import resource
+import signal
+import subprocess
+import sys
+import time
+from collections import deque
+
+import config
+from metrics import FFMPEG_CPU_SECONDS, REGISTRY, Counter
+
+# Lines of stderr kept per run for error messages
+STDERR_TAIL_LINES = 100
+# How often the watchdog checks a running FFmpeg (seconds)
+WATCHDOG_INTERVAL = 1.0
+
+FFMPEG_KILLED = REGISTRY.register(Counter(
+    "autocaption_ffmpeg_killed_total", "FFmpeg runs stopped by a watchdog, by reason"
+))
+
+class FFmpegResult:
+    """Outcome of one FFmpeg run
+
+    returncode is negative when a signal ended the run; killed_by is
+    "timeout" or "stalled" when a watchdog did. stderr keeps only the last
+    STDERR_TAIL_LINES lines.
+    """
+
+    def __init__(self, args, returncode, stderr_tail, wall_seconds, cpu_seconds=None, max_rss_mb=None, killed_by=None, stdout=None):
+        self.args = args
+        self.returncode = returncode
+        self.stderr_tail = stderr_tail
+        self.wall_seconds = wall_seconds
+        self.cpu_seconds = cpu_seconds
+        self.max_rss_mb = max_rss_mb
+        self.killed_by = killed_by
+        self.stdout = stdout
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+    @property
+    def stderr(self):
+        return '\n'.join(self.stderr_tail)
+
+    @property
+    def reason(self):
+        """Why the run ended, in a few words"""
+        if self.killed_by == "timeout":
+            return f"timed out after {self.wall_seconds:.0f}s"
+        if self.killed_by == "stalled":
+            return "stopped making progress"
+        if self.returncode < 0:
+            if -self.returncode == signal.SIGXCPU:
+                return "CPU time limit exceeded"
+            try:
+                return f"killed by {signal.Signals(-self.returncode).name}"
+            except ValueError:
+                return f"killed by signal {-self.returncode}"
+        return f"exit code {self.returncode}"
+
+    def diagnostics(self):
+        """JSON-serializable summary for the job record"""
+        return {
+            "returncode": self.returncode,
+            "reason": self.reason,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "max_rss_mb": self.max_rss_mb,
+            "stderr_tail": list(self.stderr_tail)[-20:],
+        }
+
+def apply_limits(pid, nice, max_memory_mb, max_cpu_seconds):
+    """Lower a child's priority and cap its memory and CPU time (best effort)
+
+    Applied with setpriority/prlimit right after the spawn rather than in a
+    preexec_fn, which isn't safe in a threaded server.
+    """
+    try:
+        if nice:
+            os.setpriority(os.PRIO_PROCESS, pid, nice)
+    except OSError:
+        pass
+    if not hasattr(resource, "prlimit"):
+        return
+    try:
+        if max_memory_mb:
+            limit = max_memory_mb * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        if max_cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a little later
+            resource.prlimit(pid, resource.RLIMIT_CPU, (max_cpu_seconds, max_cpu_seconds + 5))
+    except (OSError, ValueError):
+        pass
+
+async def open_pipe(pipe):
+    """StreamReader over one of a Popen's pipes"""
+    reader = asyncio.StreamReader()
+    transport, _ = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe
+    )
+    return reader, transport
+
+async def read_stderr(reader, tail):
+    """Keep the last lines of stderr (split on \\r too, for FFmpeg's stats line)"""
+    partial = b''
+    while chunk := await reader.read(65536):
+        lines = (partial + chunk).replace(b'\r', b'\n').split(b'\n')
+        partial = lines.pop()[-65536:]
+        tail.extend(line.decode(errors='replace') for line in lines if line.strip())
+    if partial.strip():
+        tail.append(partial.decode(errors='replace'))
+
+async def read_progress(reader, on_block):
+    """Pass each -progress key=value block on stdout to on_block"""
+    block = {}
+    while line := await reader.readline():
+        key, _, value = line.decode(errors='replace').strip().partition('=')
+        block[key] = value
+        if key == 'progress':
+            on_block(block)
+            block = {}
+
+async def wait_process(proc):
+    """Reap proc without blocking the event loop; returns its rusage
+
+    Returns None if a concurrent Popen.kill() reaped it first (the exit
+    status is then already on proc).
+    """
+    try:
+        pidfd = os.pidfd_open(proc.pid)
+    except (AttributeError, OSError):
+        pidfd = None
+    try:
+        if pidfd is None:
+            # No pidfd (not Linux 5.3+): wait on a worker thread instead
+            _, status, usage = await asyncio.to_thread(os.wait4, proc.pid, 0)
+        else:
+            loop = asyncio.get_running_loop()
+            exited = loop.create_future()
+            loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+            try:
+                await exited
+            finally:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+            _, status, usage = os.wait4(proc.pid, 0)
+    except ChildProcessError:
+        proc.wait()
+        return None
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+async def run_ffmpeg_async(
+    ffmpeg_cmd, on_spawn=None, on_progress=None, capture_stdout=False,
+    timeout=None, stall_timeout=None, nice=None, max_memory_mb=None, max_cpu_seconds=None
+):
+    """Run FFmpeg under watchdogs and resource limits; returns an FFmpegResult
+
+    FFmpeg reports -progress blocks on stdout; each goes to on_progress,
+    and a run whose position stops moving for stall_timeout seconds is
+    killed, as is any run past timeout. With capture_stdout, stdout is
+    returned as bytes instead (and only the timeout applies). on_spawn
+    receives the Popen so other threads can kill it; cancelling the
+    coroutine kills it too. Limits default to the config settings, 0
+    disables one.
+    """
+    timeout = config.FFMPEG_TIMEOUT_SECONDS if timeout is None else timeout
+    stall_timeout = config.FFMPEG_STALL_SECONDS if stall_timeout is None else stall_timeout
+    nice = config.FFMPEG_NICE if nice is None else nice
+    max_memory_mb = config.FFMPEG_MAX_MEMORY_MB if max_memory_mb is None else max_memory_mb
+    max_cpu_seconds = config.FFMPEG_MAX_CPU_SECONDS if max_cpu_seconds is None else max_cpu_seconds
+
+    if not capture_stdout:
+        ffmpeg_cmd = [ffmpeg_cmd[0], '-progress', 'pipe:1', '-nostats', *ffmpeg_cmd[1:]]
+    proc = subprocess.Popen(ffmpeg_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    apply_limits(proc.pid, nice, max_memory_mb, max_cpu_seconds)
+    if on_spawn is not None:
+        on_spawn(proc)
+
+    started = time.monotonic()
+    last_progress = started
+    last_position = None
+
+    def on_block(block):
+        nonlocal last_progress, last_position
+        position = (block.get('out_time_us'), block.get('total_size'), block.get('frame'))
+        if position != last_position:
+            last_position = position
+            last_progress = time.monotonic()
+        if on_progress is not None:
+            on_progress(block)
+
+    tail = deque(maxlen=STDERR_TAIL_LINES)
+    stdout_reader, stdout_transport = await open_pipe(proc.stdout)
+    stderr_reader, stderr_transport = await open_pipe(proc.stderr)
+    readers = [
+        asyncio.ensure_future(stdout_reader.read() if capture_stdout else read_progress(stdout_reader, on_block)),
+        asyncio.ensure_future(read_stderr(stderr_reader, tail)),
+    ]
+    exit_task = asyncio.ensure_future(wait_process(proc))
+    killed_by = None
+    try:
+        while not exit_task.done():
+            await asyncio.wait([exit_task], timeout=WATCHDOG_INTERVAL)
+            for reader in readers:
+                if reader.done() and reader.exception() is not None:
+                    raise reader.exception()
+            if exit_task.done() or killed_by:
+                continue
+            now = time.monotonic()
+            if timeout and now - started > timeout:
+                killed_by = "timeout"
+            elif stall_timeout and not capture_stdout and now - last_progress > stall_timeout:
+                killed_by = "stalled"
+            if killed_by:
+                FFMPEG_KILLED.inc(reason=killed_by)
+                proc.kill()
+        usage = exit_task.result()
+        stdout, _ = await asyncio.gather(*readers)
+    finally:
+        if not exit_task.done():
+            # Cancelled (or a progress callback failed): don't leave FFmpeg running
+            proc.kill()
+            await asyncio.gather(exit_task, return_exceptions=True)
+        for reader in readers:
+            reader.cancel()
+        stdout_transport.close()
+        stderr_transport.close()
+
+    cpu_seconds = max_rss_mb = None
+    if usage is not None:
+        cpu_seconds = round(usage.ru_utime + usage.ru_stime, 3)
+        FFMPEG_CPU_SECONDS.inc(cpu_seconds)
+        max_rss_mb = round(usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    return FFmpegResult(
+        ffmpeg_cmd, proc.returncode, list(tail), round(time.monotonic() - started, 3),
+        cpu_seconds=cpu_seconds,
+        max_rss_mb=max_rss_mb,
+        killed_by=killed_by,
+        stdout=stdout if capture_stdout else None,
+    )
+
+def run_ffmpeg(ffmpeg_cmd, on_spawn=None, on_progress=None, **options):
+    """run_ffmpeg_async for worker threads (each call runs its own event loop)"""
+    return asyncio.run(run_ffmpeg_async(ffmpeg_cmd, on_spawn, on_progress, **options))
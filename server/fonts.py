@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+import config
+
+# Bold faces tried in order when a template does not name its own font
+DEFAULT_FONT_PATHS = [
+    "/System/Library/Fonts/Supplemental/Arial Bold.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+]
+
+def font_key(font):
+    """Hashable identity of a font face at a size"""
+    path = getattr(font, "path", None)
+    if path is None:
+        return id(font)
+    return (path, font.size)
+
+def measure_bbox(font, text):
+    """Uncached textbbox at (0, 0), measured the way ImageDraw draws it"""
+    return ImageDraw.Draw(Image.new('RGBA', (1, 1))).textbbox((0, 0), text, font=font)
+
+class FontRegistry:
+    """Process-wide cache of loaded fonts and the text metrics measured with them
+
+    Each (path, size) is loaded once. Bounding boxes, which layout and the
+    glow effect measure words with, are kept in an LRU keyed by (font, text),
+    so words that recur across captions, highlight variants and jobs are
+    measured once.
+    """
+
+    def __init__(self, max_metrics):
+        self.max_metrics = max_metrics
+        self._lock = threading.Lock()
+        self._fonts = {}  # (path, size) -> font
+        self._missing = set()  # paths that failed to load
+        self._metrics = OrderedDict()  # (kind, font key, text) -> value, least recently used first
+        self.font_loads = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load(self, path, size):
+        key = (path, size)
+        font = self._fonts.get(key)
+        if font is None and path not in self._missing:
+            try:
+                font = ImageFont.truetype(path, size)
+            except OSError:
+                self._missing.add(path)
+                return None
+            self._fonts[key] = font
+            self.font_loads += 1
+        return font
+
+    def get(self, size, path=None):
+        """Font at size from path, else the first default face that loads"""
+        with self._lock:
+            for candidate in ([path] if path else []) + DEFAULT_FONT_PATHS:
+                font = self._load(candidate, size)
+                if font is not None:
+                    return font
+            font = self._fonts.get((None, size))
+            if font is None:
+                font = self._fonts[(None, size)] = ImageFont.load_default()
+                self.font_loads += 1
+            return font
+
+    def _metric(self, kind, font, text, measure):
+        key = (kind, font_key(font), text)
+        with self._lock:
+            value = self._metrics.get(key)
+            if value is not None:
+                self._metrics.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+        value = measure()
+        with self._lock:
+            self._metrics[key] = value
+            while len(self._metrics) > self.max_metrics:
+                self._metrics.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def bbox(self, font, text):
+        """textbbox of text drawn at (0, 0)"""
+        return self._metric("bbox", font, text, lambda: measure_bbox(font, text))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "fonts_loaded": len(self._fonts),
+                "font_loads": self.font_loads,
+                "metrics_entries": len(self._metrics),
+                "metrics_max": self.max_metrics,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+FONTS = FontRegistry(config.FONT_METRICS_CACHE_SIZE)
@@ -0,0 +1,220 @@
+import os
+import shutil
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from metrics import REGISTRY, Counter
+
+# Entries younger than this are never orphans: an upload is written before
+# its job record exists
+ORPHAN_GRACE_SECONDS = 300
+
+JANITOR_REMOVED = REGISTRY.register(Counter(
+    "autocaption_janitor_removed_total", "Files and directories removed by the janitor, by directory and reason"
+))
+JANITOR_FREED_BYTES = REGISTRY.register(Counter(
+    "autocaption_janitor_freed_bytes_total", "Bytes freed by the janitor, by directory and reason"
+))
+
+def job_key(path):
+    """Job id an entry belongs to (uploads/{job_id}.mp4, temp/{job_id}/, ...)"""
+    return path.name.split('.', 1)[0]
+
+def entry_files(path):
+    if path.is_dir() and not path.is_symlink():
+        return [p for p in path.rglob('*') if p.is_file()]
+    return [path]
+
+def usage_of(paths, seen):
+    """(bytes, files) of paths; a file hard-linked in several places counts once"""
+    size = files = 0
+    for path in paths:
+        try:
+            st = path.lstat()
+        except OSError:
+            continue
+        files += 1
+        if (st.st_dev, st.st_ino) not in seen:
+            seen.add((st.st_dev, st.st_ino))
+            size += st.st_size
+    return size, files
+
+def remove_entry(path):
+    """Delete a file or directory tree; returns the bytes actually freed
+
+    Files still hard-linked elsewhere (e.g. outputs shared with the render
+    cache) free nothing.
+    """
+    freed = 0
+    for file in entry_files(path):
+        try:
+            st = file.lstat()
+        except OSError:
+            continue
+        if st.st_nlink == 1:
+            freed += st.st_size
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+    return freed
+
+class Janitor:
+    """Expires working files and keeps the server's disk use under a quota
+
+    dirs maps a name to (directory, TTL in seconds, 0 = keep). Entries are
+    named after their job, and those of queued or processing jobs are never
+    touched. A sweep removes expired entries; with orphans it also removes
+    leftovers of jobs that aren't running in the orphan_dirs. Then, while
+    the total is over quota_bytes, entries of the evict directory are
+    removed least recently used first (see touch); files hard-linked into
+    the render cache are left to the cache's own size limit.
+    """
+
+    def __init__(self, store, dirs, quota_bytes=0, evict="outputs", orphan_dirs=("uploads", "temp", "scratch")):
+        self.store = store
+        self.dirs = {}
+        self.aliases = {}  # name -> name the directory is reported under
+        resolved = {}
+        for name, (directory, ttl) in dirs.items():
+            # The same directory under two names (e.g. scratch in temp) is swept once
+            path = Path(directory).resolve()
+            if path in resolved:
+                self.aliases[name] = resolved[path]
+                continue
+            resolved[path] = name
+            self.dirs[name] = (Path(directory), ttl)
+        self.quota_bytes = quota_bytes
+        self.evict = evict
+        self.orphan_dirs = orphan_dirs
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.removed = {}  # directory name -> reason -> entries removed
+        self.freed_bytes = 0
+        self.last_sweep = None
+
+    def active_jobs(self):
+        return {job_id for job_id, *_ in self.store.list_jobs("queued", "processing")}
+
+    def _remove(self, name, path, reason):
+        freed = remove_entry(path)
+        reasons = self.removed.setdefault(name, {})
+        reasons[reason] = reasons.get(reason, 0) + 1
+        self.freed_bytes += freed
+        JANITOR_REMOVED.inc(dir=name, reason=reason)
+        JANITOR_FREED_BYTES.inc(freed, dir=name, reason=reason)
+        return freed
+
+    def _entries(self, name):
+        directory = self.dirs[name][0]
+        return list(directory.iterdir()) if directory.is_dir() else []
+
+    def discard(self, name, path):
+        """Remove a finished job's leftover file or directory, if it is still there"""
+        path = Path(path)
+        if os.path.lexists(path):
+            with self._lock:
+                self._remove(self.aliases.get(name, name), path, "job")
+
+    def touch(self, path):
+        """Mark an evictable entry as just used (its atime; mtime and ETags stay)"""
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+        except OSError:
+            pass
+
+    def sweep(self, orphans=False):
+        """Run one sweep; returns the number of entries removed"""
+        with self._lock:
+            now = time.time()
+            active = self.active_jobs()
+            removed = 0
+            for name, (_, ttl) in self.dirs.items():
+                for path in self._entries(name):
+                    if job_key(path) in active:
+                        continue
+                    try:
+                        age = now - path.lstat().st_mtime
+                    except OSError:
+                        continue
+                    if ttl and age > ttl:
+                        self._remove(name, path, "ttl")
+                        removed += 1
+                    elif (
+                        orphans and name in self.orphan_dirs and age > ORPHAN_GRACE_SECONDS
+                        and not path.name.endswith('.part')  # resumable uploads expire by TTL only
+                    ):
+                        self._remove(name, path, "orphan")
+                        removed += 1
+            if self.quota_bytes and self.evict in self.dirs:
+                removed += self._enforce_quota(active)
+            self.last_sweep = now
+            return removed
+
+    def _enforce_quota(self, active):
+        total = sum(entry["bytes"] for entry in self.usage().values())
+        candidates = []
+        for path in self._entries(self.evict):
+            if job_key(path) in active:
+                continue
+            try:
+                st = path.lstat()
+            except OSError:
+                continue
+            if st.st_nlink > 1:
+                # Shared with the render cache: removing it frees nothing
+                continue
+            candidates.append((st.st_atime, path))
+        evicted = 0
+        for _, path in sorted(candidates):
+            if total <= self.quota_bytes:
+                break
+            freed = self._remove(self.evict, path, "quota")
+            evicted += 1
+            if not freed:
+                break
+            total -= freed
+        return evicted
+
+    def usage(self):
+        """Bytes and file count per directory"""
+        seen = set()
+        usage = {}
+        for name in self.dirs:
+            files = [file for path in self._entries(name) for file in entry_files(path)]
+            size, count = usage_of(files, seen)
+            usage[name] = {"bytes": size, "files": count}
+        return usage
+
+    def stats(self):
+        usage = self.usage()
+        return {
+            "dirs": usage,
+            "total_bytes": sum(entry["bytes"] for entry in usage.values()),
+            "quota_bytes": self.quota_bytes,
+            "removed": self.removed,
+            "freed_bytes": self.freed_bytes,
+            "last_sweep": self.last_sweep,
+        }
+
+    def start(self, interval):
+        """Sweep every interval seconds on a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="janitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception:
+                traceback.print_exc()
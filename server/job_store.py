@@ -0,0 +1,284 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Fields that change many times per job and can be written lazily
+BATCHED_FIELDS = {"progress", "encoded_seconds", "fps", "speed", "eta_seconds"}
+
+class JobStore:
+    """Interface for job state shared between the API and the workers
+
+    A job is a record (the dict returned by /status) plus the task kwargs
+    needed to run it again after a restart.
+    """
+
+    def create(self, job_id, record, task=None, priority=0):
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """Job record, or None if the job does not exist"""
+        raise NotImplementedError
+
+    def update(self, job_id, **fields):
+        raise NotImplementedError
+
+    def claim(self, job_id, owner):
+        """Atomically move a queued job to processing; False if taken"""
+        raise NotImplementedError
+
+    def get_task(self, job_id):
+        raise NotImplementedError
+
+    def list_jobs(self, *statuses):
+        """(job_id, record, priority, owner) for jobs in the given statuses"""
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+    def __contains__(self, job_id):
+        return self.get(job_id) is not None
+
+class MemoryJobStore(JobStore):
+    """Process-local store; state is lost on restart"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def create(self, job_id, record, task=None, priority=0):
+        with self._lock:
+            self._jobs[job_id] = {**record, "_priority": priority, "_owner": None}
+            self._tasks[job_id] = task
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {k: v for k, v in job.items() if not k.startswith("_")}
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def claim(self, job_id, owner):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != "queued":
+                return False
+            job.update(status="processing", _owner=owner)
+            return True
+
+    def get_task(self, job_id):
+        with self._lock:
+            return self._tasks.get(job_id)
+
+    def list_jobs(self, *statuses):
+        with self._lock:
+            return [
+                (job_id, {k: v for k, v in job.items() if not k.startswith("_")}, job["_priority"], job["_owner"])
+                for job_id, job in self._jobs.items()
+                if job["status"] in statuses
+            ]
+
+class SQLiteJobStore(JobStore):
+    """SQLite (WAL) store that several server processes can share
+
+    Status changes are written immediately; progress-only updates are
+    buffered and flushed at most every flush_interval seconds.
+    """
+
+    def __init__(self, path, flush_interval=1.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                record TEXT NOT NULL,
+                task TEXT,
+                priority INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created_at);
+        """)
+        self._lock = threading.RLock()
+        self._pending = {}  # job_id -> buffered fields
+        self._last_flush = time.monotonic()
+
+    def create(self, job_id, record, task=None, priority=0):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, record, task, priority, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, record["status"], json.dumps(record), json.dumps(task) if task is not None else None, priority, now, now)
+            )
+
+    def _read(self, job_id):
+        row = self._conn.execute("SELECT record FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, job_id):
+        with self._lock:
+            record = self._read(job_id)
+            if record is None:
+                return None
+            record.update(self._pending.get(job_id, {}))
+            return record
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            self._pending.setdefault(job_id, {}).update(fields)
+            if not fields.keys() <= BATCHED_FIELDS:
+                self._write(job_id)
+            elif time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def _write(self, job_id):
+        fields = self._pending.pop(job_id, None)
+        if not fields:
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            record = self._read(job_id)
+            if record is not None:
+                record.update(fields)
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, record = ?, updated_at = ? WHERE id = ?",
+                    (record["status"], json.dumps(record), time.time(), job_id)
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def flush(self):
+        with self._lock:
+            for job_id in list(self._pending):
+                self._write(job_id)
+            self._last_flush = time.monotonic()
+
+    def claim(self, job_id, owner):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                record = self._read(job_id)
+                claimed = record is not None and record["status"] == "queued"
+                if claimed:
+                    record["status"] = "processing"
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, record = ?, owner = ?, updated_at = ? WHERE id = ?",
+                        ("processing", json.dumps(record), owner, time.time(), job_id)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return claimed
+
+    def get_task(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT task FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            return json.loads(row[0]) if row and row[0] else None
+
+    def list_jobs(self, *statuses):
+        self.flush()
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, record, priority, owner FROM jobs WHERE status IN ({placeholders}) ORDER BY priority DESC, created_at",
+                statuses
+            ).fetchall()
+        return [(job_id, json.loads(record), priority, owner) for job_id, record, priority, owner in rows]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+def open_job_store(path):
+    """SQLite store at path, or an in-memory store when path is empty"""
+    if not path:
+        return MemoryJobStore()
+    return SQLiteJobStore(path)
+
+def process_start_token(pid):
+    """Boot id and start time of a process, so a reused pid isn't taken for it ("" if unknown)"""
+    try:
+        boot_id = Path("/proc/sys/kernel/random/boot_id").read_text().strip()
+        stat = Path(f"/proc/{pid}/stat").read_text()
+    except OSError:
+        return ""
+    # starttime is field 22; the command name (field 2) may contain spaces
+    return f"{boot_id[:8]}-{stat.rpartition(')')[2].split()[19]}"
+
+def worker_identity():
+    """Owner tag for jobs claimed by this process (host:pid:start token)"""
+    return f"{socket.gethostname()}:{os.getpid()}:{process_start_token(os.getpid())}"
+
+def owner_is_alive(owner):
+    """Whether the process that claimed a job is still running on this host
+    
+    Only used while recovering at startup, when this process hasn't claimed
+    anything: a job under its own identity was claimed by an earlier
+    process that had the same host and pid (e.g. PID 1 in a restarted
+    container), so it is dead.
+    """
+    if not owner or owner == worker_identity():
+        return False
+    host, _, rest = owner.partition(":")
+    pid, _, token = rest.partition(":")
+    if host != socket.gethostname():
+        # Can't see other hosts' processes; assume they are alive
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except (ProcessLookupError, ValueError):
+        return False
+    except PermissionError:
+        pass
+    # Same pid, different start: the pid was reused after the owner died
+    return not token or process_start_token(pid) in ("", token)
+
+def recover_jobs(store, scheduler):
+    """Re-queue jobs that were queued or interrupted when a server stopped"""
+    recovered = 0
+    pending = store.list_jobs("queued", "processing")
+    failed = set()
+    for job_id, record, priority, owner in pending:
+        if record["status"] == "processing" and owner_is_alive(owner):
+            continue
+        if "batch_job" in record:
+            # Outputs of a batch are settled when the batch job runs again
+            continue
+        task = store.get_task(job_id)
+        if task is None or not os.path.exists(task["video_path"]):
+            store.update(job_id, status="failed", error="Interrupted by server restart")
+            failed.add(job_id)
+            continue
+        if record["status"] == "processing":
+            store.update(job_id, status="queued", progress=0)
+        scheduler.submit(job_id, task, priority=priority)
+        recovered += 1
+
+    # Outputs whose batch job won't run again would stay queued forever
+    running = {job_id for job_id, *_ in pending} - failed
+    for job_id, record, *_ in pending:
+        if "batch_job" in record and record["batch_job"] not in running:
+            store.update(job_id, status="failed", error="Interrupted by server restart")
+    return recovered
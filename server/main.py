@@ -1,14 +1,40 @@
-from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request, Header
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import asyncio
+import cProfile
 import json
+import time
 import uuid
 import os
 from pathlib import Path
-from processor import process_video
+from processor import TEMPLATES, process_video, process_video_batch
+from chunked import process_video_chunked
+from scheduler import JobScheduler
+from job_store import open_job_store, recover_jobs, worker_identity
+from downloads import WholeFileResponse, if_range_matches, not_modified, parse_byte_range, read_file_range
+from uploads import ResumableUploads, UploadError, UploadSizeLimit, save_upload_stream
+from planner import check_limits
+from probe import probe_media
+from render_cache import RenderCache, link_or_copy, render_key
+from janitor import Janitor
+from preview import PREVIEW_FORMATS, render_preview
+from timeline import compile_timeline, parse_time_to_seconds
+from fonts import FONTS
+from metrics import REGISTRY, STAGE_SECONDS, Gauge
+import config
 
 app = FastAPI(title="Auto Caption Server")
 
+# Refuse oversized form uploads before they are spooled to disk (with room
+# for the captions and other form fields)
+app.add_middleware(
+    UploadSizeLimit,
+    paths=["/upload", "/upload/batch", "/preview"],
+    max_bytes=config.MAX_UPLOAD_BYTES,
+    overhead_bytes=4 * 1024 * 1024,
+)
+
 # CORS for Flutter app
 app.add_middleware(
     CORSMiddleware,
@@ -21,53 +47,433 @@ app.add_middleware(
 # Storage
 UPLOAD_DIR = Path("uploads")
 OUTPUT_DIR = Path("outputs")
+SOURCE_DIR = Path(config.SOURCE_DIR)
+PROFILE_DIR = Path(config.PROFILE_DIR)
 UPLOAD_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
+SOURCE_DIR.mkdir(exist_ok=True)
+
+# Job status storage (SQLite by default, shared by all server processes)
+jobs = open_job_store(config.JOB_DB)
+
+# Resumable chunked uploads for flaky mobile connections
+resumable_uploads = ResumableUploads(UPLOAD_DIR, config.MAX_UPLOAD_BYTES, config.UPLOAD_CHUNK_BYTES)
+
+# Content-addressed cache of finished renders
+render_cache = RenderCache(config.CACHE_DIR, config.CACHE_MAX_BYTES)
+
+# TTLs and the disk quota for everything above (the render cache sizes itself)
+janitor = Janitor(jobs, {
+    "uploads": (UPLOAD_DIR, config.UPLOAD_TTL_HOURS * 3600),
+    "temp": (Path(config.TEMP_DIR), config.TEMP_TTL_HOURS * 3600),
+    "scratch": (Path(config.SCRATCH_DIR), config.TEMP_TTL_HOURS * 3600),
+    "outputs": (OUTPUT_DIR, config.OUTPUT_TTL_HOURS * 3600),
+    "sources": (SOURCE_DIR, config.SOURCE_TTL_HOURS * 3600),
+    "cache": (Path(config.CACHE_DIR), 0),
+}, config.DISK_QUOTA_BYTES)
+
+def run_job(job_id, store, profile=False, **task):
+    """Process a job, under cProfile if it asked for it and profiling is on
+    
+    Whatever way the job ends, its upload and working files are removed.
+    """
+    try:
+        if profile and config.PROFILE_JOBS:
+            profile_job(job_id, store, **task)
+        else:
+            process_job(job_id, store, **task)
+    finally:
+        cleanup_job(job_id, task)
+
+def cleanup_job(job_id, task):
+    """Remove a finished job's upload and temp files, and outputs that didn't complete"""
+    janitor.discard("uploads", task["video_path"])
+    janitor.discard("scratch", Path(config.SCRATCH_DIR) / job_id)
+    janitor.discard("temp", Path(config.TEMP_DIR) / job_id)
+    outputs = [(job_id, task.get("output_path"))]
+    outputs.extend((variant["job_id"], variant["output_path"]) for variant in task.get("variants", []))
+    for output_id, output_path in outputs:
+        job = jobs.get(output_id)
+        if output_path and (job is None or job["status"] != "completed"):
+            janitor.discard("outputs", output_path)
+
+def profile_job(job_id, store, **task):
+    """Process a job under cProfile, saving the stats next to the job"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler; this job runs unprofiled
+        return process_job(job_id, store, **task)
+    try:
+        process_job(job_id, store, **task)
+    finally:
+        profiler.disable()
+        PROFILE_DIR.mkdir(exist_ok=True)
+        profile_path = PROFILE_DIR / f"{job_id}.prof"
+        profiler.dump_stats(profile_path)
+        store.update(job_id, profile_path=str(profile_path))
+
+def process_job(job_id, store, cache_key=None, variants=None, duration=None, media=None, **task):
+    """Process a job, then cache its output and complete coalesced jobs"""
+    # The pipeline is planned from the upload's probe against the queue as it is now
+    task.update(media=media, queue_depth=scheduler.queue_depth())
+    if variants is not None:
+        process_video_batch(job_id=job_id, store=store, variants=variants, **task)
+        if store.get(job_id)["status"] == "completed":
+            for variant in variants:
+                render_cache.put(variant["cache_key"], variant["output_path"])
+        return
+    
+    # Long videos are split into chunks and encoded in parallel
+    if media is not None and media["duration"] is not None:
+        duration = min(media["duration"], config.MAX_VIDEO_SECONDS)
+    use_chunked = (
+        config.CHUNKED_MIN_SECONDS > 0
+        and duration is not None and duration >= config.CHUNKED_MIN_SECONDS
+        and task.get("render_mode") != "overlays"
+    )
+    process = process_video_chunked if use_chunked else process_video
+    if cache_key is None:
+        process(job_id=job_id, store=store, **task)
+        return
+    
+    try:
+        process(job_id=job_id, store=store, **task)
+        if store.get(job_id)["status"] == "completed":
+            render_cache.put(cache_key, task["output_path"])
+    finally:
+        # Jobs waiting on this one must never be left queued
+        settle_coalesced_jobs(job_id, cache_key)
+
+def settle_coalesced_jobs(leader_id, cache_key):
+    """Give jobs waiting on leader_id its output (or its failure)"""
+    leader = jobs.get(leader_id)
+    for follower_id in render_cache.release(cache_key):
+        follower = jobs.get(follower_id)
+        if follower is None or follower["status"] != "queued":
+            continue
+        if leader["status"] == "completed":
+            link_or_copy(OUTPUT_DIR / f"{leader_id}.mp4", OUTPUT_DIR / f"{follower_id}.mp4")
+            jobs.update(follower_id, status="completed", progress=100)
+        elif leader["status"] in TERMINAL_STATUSES:
+            reason = f": {leader['error']}" if leader.get("error") else ""
+            jobs.update(follower_id, status="failed", error=f"Coalesced job {leader_id} {leader['status']}{reason}")
+        else:
+            # Taken over by another server process, which doesn't know about this follower
+            jobs.update(follower_id, status="failed", error=f"Coalesced job {leader_id} moved to another server process; upload again")
+
+def skip_job(job_id, task):
+    """A queued job this process couldn't claim (cancelled or taken elsewhere)
+    
+    Nothing here will run it, so settle what waits on it in this process.
+    """
+    if task.get("cache_key"):
+        settle_coalesced_jobs(job_id, task["cache_key"])
+    job = jobs.get(job_id)
+    if job is not None and job["status"] in TERMINAL_STATUSES:
+        for variant in task.get("variants", []):
+            jobs.update(variant["job_id"], status=job["status"])
+        cleanup_job(job_id, task)
+
+def job_is_active(job_id):
+    job = jobs.get(job_id)
+    return job is not None and job["status"] not in TERMINAL_STATUSES
+
+# Bounded worker pool: at most MAX_WORKERS encodes run at once
+scheduler = JobScheduler(
+    jobs, run_job, config.MAX_WORKERS, config.FFMPEG_THREADS, worker_identity(), on_skip=skip_job
+)
+
+REGISTRY.register(Gauge("autocaption_queue_depth", "Jobs waiting for a worker", scheduler.queue_depth))
+REGISTRY.register(Gauge("autocaption_encodes_in_flight", "Jobs being processed", scheduler.running_count))
+
+@app.post("/uploads")
+async def create_upload(size: int = Form(None)):
+    """Start a resumable upload; send chunks with PUT /uploads/{upload_id}"""
+    try:
+        upload_id = resumable_uploads.create(size)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    return {"upload_id": upload_id, "offset": 0, "chunk_size": config.UPLOAD_CHUNK_BYTES}
 
-# Job status storage (in production, use Redis)
-jobs = {}
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Bytes received so far, i.e. where to resume"""
+    offset = resumable_uploads.offset(upload_id)
+    if offset is None:
+        return JSONResponse({"error": "Upload not found"}, status_code=404)
+    return {"upload_id": upload_id, "offset": offset}
+
+@app.put("/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request, upload_offset: int = Header(...)):
+    """Append the request body at Upload-Offset"""
+    try:
+        offset = await resumable_uploads.append(upload_id, upload_offset, request.stream())
+    except UploadError as e:
+        return JSONResponse({"error": str(e), "offset": resumable_uploads.offset(upload_id)}, status_code=e.status_code)
+    return {"upload_id": upload_id, "offset": offset}
+
+async def save_video(job_id, video, upload_id):
+    """Store the job's source video
+    
+    Returns (path, size, sha256 hex, media info, timings) where timings
+    seeds the job's per-stage timings with the upload stage.
+    """
+    started = time.perf_counter()
+    # Save uploaded video (streamed in chunks, never fully in memory)
+    video_path = UPLOAD_DIR / f"{job_id}.mp4"
+    if upload_id:
+        video_size, video_hash = await resumable_uploads.finish(upload_id, video_path)
+    elif video is not None:
+        video_size, video_hash = await save_upload_stream(
+            video, video_path, config.MAX_UPLOAD_BYTES, config.UPLOAD_CHUNK_BYTES
+        )
+    else:
+        raise UploadError("Send a video file or an upload_id")
+    
+    # Reject (or mark for trimming) sources over the limits before any work
+    media = await asyncio.to_thread(probe_media, video_path)
+    if media is not None:
+        try:
+            check_limits(media)
+        except ValueError as e:
+            os.remove(video_path)
+            raise UploadError(str(e), 413)
+    
+    await asyncio.to_thread(keep_source, video_path, video_hash)
+    
+    elapsed = time.perf_counter() - started
+    STAGE_SECONDS.observe(elapsed, stage="upload")
+    timings = {"upload": {"seconds": round(elapsed, 3), "bytes": video_size}}
+    return video_path, video_size, video_hash, media, timings
+
+def source_path(video_hash):
+    """Where the source video with this content hash is kept"""
+    if len(video_hash) != 64 or any(c not in "0123456789abcdef" for c in video_hash):
+        return None
+    return SOURCE_DIR / f"{video_hash}.mp4"
+
+def keep_source(video_path, video_hash):
+    """Hard-link an upload into the source store (no extra disk space)"""
+    path = source_path(video_hash)
+    if not path.exists():
+        link_or_copy(video_path, path)
+
+def parse_captions(value):
+    """Caption JSON from a form field; ValueError if it is malformed"""
+    captions_data = json.loads(value)
+    compile_timeline(captions_data)
+    return captions_data
+
+def parse_list_field(value):
+    """Form field holding a JSON list or a comma separated string"""
+    try:
+        items = json.loads(value)
+    except json.JSONDecodeError:
+        items = value.split(',')
+    if isinstance(items, str):
+        items = [items]
+    return [str(item).strip() for item in items if str(item).strip()]
 
 @app.post("/upload")
 async def upload_video(
-    background_tasks: BackgroundTasks,
-    video: UploadFile = File(...),
+    video: UploadFile = File(None),
+    upload_id: str = Form(None),  # Finished resumable upload instead of a file
     captions: str = Form(...),
     aspect_ratio: str = Form(...),
-    template: str = Form("classic")  # Default to classic template
+    template: str = Form("classic"),  # Default to classic template
+    render_mode: str = Form("track"),  # "track" or legacy "overlays"
+    engine: str = Form("pillow"),  # "pillow" (PNG rasterization) or "ass" (libass)
+    priority: int = Form(0),  # Higher runs first (e.g. premium users)
+    profile: bool = Form(False)  # cProfile the job (only with AUTOCAPTION_PROFILE_JOBS)
 ):
     """Upload video and captions for processing"""
     job_id = str(uuid.uuid4())
     
-    # Save uploaded video
-    video_path = UPLOAD_DIR / f"{job_id}.mp4"
-    with open(video_path, "wb") as f:
-        content = await video.read()
-        f.write(content)
-    
-    # Parse captions
-    captions_data = json.loads(captions)
-    
-    # Initialize job status
-    jobs[job_id] = {"status": "queued", "progress": 0}
-    
-    # Process in background
-    background_tasks.add_task(
-        process_video,
-        str(video_path),
-        captions_data,
-        aspect_ratio,
-        str(OUTPUT_DIR / f"{job_id}.mp4"),
-        job_id,
-        jobs,
-        template  # Pass template to processor
-    )
+    # Parse captions (rejected before the video is stored)
+    try:
+        captions_data = parse_captions(captions)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid captions: {e}"}, status_code=400)
+    
+    try:
+        video_path, video_size, video_hash, media, timings = await save_video(job_id, video, upload_id)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    
+    output_path = OUTPUT_DIR / f"{job_id}.mp4"
+    cache_key = render_key(video_hash, captions_data, template, aspect_ratio, engine)
+    record = {"status": "queued", "progress": 0, "video_hash": video_hash, "video_size": video_size, "timings": timings}
+    
+    # Identical render already done: serve it straight from the cache
+    if render_cache.fetch(cache_key, output_path):
+        os.remove(video_path)
+        jobs.create(job_id, {**record, "status": "completed", "progress": 100, "cache": "hit"}, priority=priority)
+        return {"job_id": job_id, "status": "completed", "cache": "hit"}
+    
+    # Identical render already encoding: wait for it instead of encoding again
+    leader_id = render_cache.join(cache_key, job_id, is_active=job_is_active)
+    if leader_id is not None:
+        os.remove(video_path)
+        jobs.create(job_id, {**record, "cache": "coalesced", "coalesced_with": leader_id}, priority=priority)
+        return {"job_id": job_id, "status": "queued", "cache": "coalesced"}
+    
+    task = {
+        "video_path": str(video_path),
+        "captions": captions_data,
+        "aspect_ratio": aspect_ratio,
+        "output_path": str(output_path),
+        "template": template,  # Pass template to processor
+        "render_mode": render_mode,
+        "engine": engine,
+        "cache_key": cache_key,
+        "media": media,
+    }
+    if profile and config.PROFILE_JOBS:
+        task["profile"] = True
+    
+    # Initialize job status (the task is kept so the job survives a restart)
+    jobs.create(job_id, {**record, "cache": "miss"}, task, priority=priority)
+    
+    # Queue for the worker pool
+    scheduler.submit(job_id, task, priority=priority)
     
-    return {"job_id": job_id, "status": "queued"}
+    return {"job_id": job_id, "status": "queued", "queue_position": scheduler.queue_position(job_id)}
+
+@app.post("/upload/batch")
+async def upload_video_batch(
+    video: UploadFile = File(None),
+    upload_id: str = Form(None),
+    captions: str = Form(...),
+    templates: str = Form(...),  # JSON list or comma separated, e.g. "classic,neon"
+    aspect_ratios: str = Form("9:16"),  # JSON list or comma separated
+    engine: str = Form("pillow"),
+    priority: int = Form(0)
+):
+    """Render one video with several templates/aspect ratios in one FFmpeg run"""
+    job_id = str(uuid.uuid4())
+    
+    template_list = parse_list_field(templates)
+    aspect_ratio_list = parse_list_field(aspect_ratios)
+    if not template_list or not aspect_ratio_list:
+        return JSONResponse({"error": "Give at least one template and aspect ratio"}, status_code=400)
+    unknown = [t for t in template_list if t not in TEMPLATES]
+    if unknown:
+        return JSONResponse({"error": f"Unknown templates: {', '.join(unknown)}"}, status_code=400)
+    
+    try:
+        captions_data = parse_captions(captions)
+    except ValueError as e:
+        return JSONResponse({"error": f"Invalid captions: {e}"}, status_code=400)
+    
+    try:
+        video_path, video_size, video_hash, media, timings = await save_video(job_id, video, upload_id)
+    except UploadError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    
+    # One output job per (aspect ratio, template); cached ones finish right away
+    outputs = []
+    variants = []
+    for aspect_ratio in dict.fromkeys(aspect_ratio_list):
+        for template in dict.fromkeys(template_list):
+            output_id = str(uuid.uuid4())
+            output_path = OUTPUT_DIR / f"{output_id}.mp4"
+            cache_key = render_key(video_hash, captions_data, template, aspect_ratio, engine)
+            record = {"status": "queued", "progress": 0, "batch_job": job_id, "template": template, "aspect_ratio": aspect_ratio}
+            if render_cache.fetch(cache_key, output_path):
+                jobs.create(output_id, {**record, "status": "completed", "progress": 100, "cache": "hit"})
+            else:
+                jobs.create(output_id, {**record, "cache": "miss"})
+                variants.append({
+                    "job_id": output_id,
+                    "template": template,
+                    "aspect_ratio": aspect_ratio,
+                    "output_path": str(output_path),
+                    "cache_key": cache_key,
+                })
+            outputs.append({
+                "job_id": output_id,
+                "template": template,
+                "aspect_ratio": aspect_ratio,
+                "download_url": f"/download/{output_id}",
+            })
+    
+    record = {
+        "status": "queued", "progress": 0, "video_hash": video_hash, "video_size": video_size,
+        "outputs": outputs, "timings": timings,
+    }
+    if not variants:
+        os.remove(video_path)
+        jobs.create(job_id, {**record, "status": "completed", "progress": 100})
+        return {"job_id": job_id, "status": "completed", "outputs": outputs}
+    
+    task = {
+        "video_path": str(video_path),
+        "captions": captions_data,
+        "variants": variants,
+        "engine": engine,
+        "media": media,
+    }
+    jobs.create(job_id, record, task, priority=priority)
+    scheduler.submit(job_id, task, priority=priority)
+    
+    return {"job_id": job_id, "status": "queued", "queue_position": scheduler.queue_position(job_id), "outputs": outputs}
+
+def parse_timestamp(value):
+    """Seconds from either a number or the caption MM:SS:mmm format"""
+    try:
+        return float(value)
+    except ValueError:
+        return parse_time_to_seconds(value)
+
+@app.post("/preview")
+async def preview_frame(
+    video: UploadFile = File(None),
+    video_hash: str = Form(None),  # Content hash of an earlier upload instead of a file
+    captions: str = Form(...),
+    timestamp: str = Form(...),  # Seconds or MM:SS:mmm
+    aspect_ratio: str = Form("9:16"),
+    template: str = Form("classic"),
+    format: str = Form("jpeg"),  # "jpeg" or "png"
+):
+    """Render the single frame at timestamp with its caption, without encoding"""
+    if format not in PREVIEW_FORMATS:
+        return JSONResponse({"error": f"Unknown format: {format}"}, status_code=400)
+    
+    if video_hash:
+        video_path = source_path(video_hash)
+        if video_path is None or not video_path.exists():
+            return JSONResponse({"error": "Video not found"}, status_code=404)
+    elif video is not None:
+        upload_path = UPLOAD_DIR / f"preview_{uuid.uuid4()}.mp4"
+        try:
+            _, video_hash = await save_upload_stream(
+                video, upload_path, config.MAX_UPLOAD_BYTES, config.UPLOAD_CHUNK_BYTES
+            )
+        except UploadError as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        # Keep it so the next preview of this video can send only the hash
+        await asyncio.to_thread(keep_source, upload_path, video_hash)
+        os.remove(upload_path)
+        video_path = source_path(video_hash)
+    else:
+        return JSONResponse({"error": "Send a video file or a video_hash"}, status_code=400)
+    
+    try:
+        captions_data = parse_captions(captions)
+        content, media_type = await render_preview(
+            video_path, captions_data, template, aspect_ratio,
+            parse_timestamp(timestamp), format
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    
+    return Response(content, media_type=media_type, headers={"X-Video-Hash": video_hash})
 
 @app.get("/templates")
 async def get_templates():
     """Get available caption templates"""
-    from processor import TEMPLATES
     return {
         "templates": [
             {"id": key, "name": val["name"]} 
@@ -75,32 +481,237 @@ async def get_templates():
         ]
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics for this server process"""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def get_stats():
+    """Cache counters and disk usage, for sizing caches and volumes"""
+    return {
+        "render_cache": render_cache.stats(),
+        "fonts": FONTS.stats(),
+        "disk": await asyncio.to_thread(janitor.stats),
+    }
+
+def get_job(job_id):
+    """Job record, falling back to finished outputs the store no longer knows"""
+    job = jobs.get(job_id)
+    if job is None and (OUTPUT_DIR / f"{job_id}.mp4").exists():
+        job = {"status": "completed", "progress": 100}
+    return job
+
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
     """Check processing status"""
-    if job_id not in jobs:
+    status = get_job(job_id)
+    if status is None:
         return {"error": "Job not found"}, 404
-    return jobs[job_id]
+    if status["status"] == "queued":
+        status["queue_position"] = scheduler.queue_position(job_id)
+        status["queue_depth"] = scheduler.queue_depth()
+    status["cache_stats"] = render_cache.stats()
+    return status
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-sent events with the job's status each time it changes
+    
+    One stream replaces polling /status; it ends once the job finishes.
+    """
+    if get_job(job_id) is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    
+    async def events():
+        last = None
+        idle = 0.0
+        while not await request.is_disconnected():
+            job = get_job(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error": "Job not found"}\n\n'
+                return
+            if job["status"] == "queued":
+                job["queue_position"] = scheduler.queue_position(job_id)
+            data = json.dumps(job)
+            if data != last:
+                yield f"event: status\ndata: {data}\n\n"
+                last = data
+                idle = 0.0
+            elif idle >= 15:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(0.5)
+            idle += 0.5
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/jobs/{job_id}/profile")
+async def job_profile(job_id: str):
+    """cProfile stats of a profiled job (load with pstats or snakeviz)"""
+    job = jobs.get(job_id)
+    if job is None or not job.get("profile_path") or not os.path.exists(job["profile_path"]):
+        return JSONResponse({"error": "No profile for this job"}, status_code=404)
+    return FileResponse(job["profile_path"], media_type="application/octet-stream", filename=f"{job_id}.prof")
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued job or kill its running encode"""
+    job = jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if scheduler.cancel(job_id):
+        task = jobs.get_task(job_id)
+        if task and jobs.get(job_id)["status"] == "cancelled":
+            # Never reached a worker, so run_job won't settle its followers or outputs
+            cleanup_job(job_id, task)
+            if task.get("cache_key"):
+                settle_coalesced_jobs(job_id, task["cache_key"])
+            for variant in task.get("variants", []):
+                jobs.update(variant["job_id"], status="cancelled")
+    else:
+        if job["status"] == "queued":
+            # Queued on another server process; it will skip the job when claiming
+            jobs.update(job_id, status="cancelled")
+            return {"job_id": job_id, "status": "cancelled"}
+        if job["status"] == "processing":
+            return JSONResponse({"error": "Job is running on another server process"}, status_code=409)
+        return JSONResponse({"error": f"Job is already {job['status']}"}, status_code=409)
+    job = jobs.get(job_id)
+    return {"job_id": job_id, "status": "cancelling" if job["status"] == "processing" else job["status"]}
+
+# Read size and poll interval while tailing an output that is being encoded
+STREAM_CHUNK_BYTES = 256 * 1024
+STREAM_POLL_SECONDS = 0.25
 
 @app.get("/download/{job_id}")
-async def download_video(job_id: str):
-    """Download processed video"""
-    if job_id not in jobs:
+async def download_video(job_id: str, request: Request):
+    """Download processed video (with Range, ETag and conditional requests)"""
+    job = get_job(job_id)
+    if job is None:
         return {"error": "Job not found"}, 404
     
-    if jobs[job_id]["status"] != "completed":
+    if job["status"] != "completed":
         return {"error": "Video not ready"}, 400
     
     output_path = OUTPUT_DIR / f"{job_id}.mp4"
-    return FileResponse(
+    # Downloads keep an output at the back of the quota eviction order
+    janitor.touch(output_path)
+    
+    disposition = 'attachment; filename="captioned_video.mp4"'
+    if config.DOWNLOAD_ACCEL_REDIRECT:
+        # nginx sends the file itself (sendfile, ranges, conditional requests)
+        return Response(media_type="video/mp4", headers={
+            "X-Accel-Redirect": f"{config.DOWNLOAD_ACCEL_REDIRECT}{job_id}.mp4",
+            "Content-Disposition": disposition,
+        })
+    
+    try:
+        stat_result = os.stat(output_path)
+    except FileNotFoundError:
+        return JSONResponse({"error": "Video not found"}, status_code=404)
+    response = WholeFileResponse(
         output_path,
         media_type="video/mp4",
-        filename="captioned_video.mp4"
+        filename="captioned_video.mp4",
+        stat_result=stat_result,
+        headers={"Accept-Ranges": "bytes"}
     )
+    if not_modified(request, response):
+        return Response(status_code=304, headers={
+            "ETag": response.headers["etag"], "Last-Modified": response.headers["last-modified"]
+        })
+    
+    # Ranges are answered here so every Starlette version treats them the same
+    range_header = request.headers.get("range")
+    if range_header and if_range_matches(request, response):
+        size = stat_result.st_size
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            first, last = byte_range
+            return StreamingResponse(read_file_range(output_path, first, last, STREAM_CHUNK_BYTES), status_code=206, media_type="video/mp4", headers={
+                "Accept-Ranges": "bytes",
+                "Content-Range": f"bytes {first}-{last}/{size}",
+                "Content-Length": str(last - first + 1),
+                "Content-Disposition": response.headers["content-disposition"],
+                "ETag": response.headers["etag"],
+                "Last-Modified": response.headers["last-modified"],
+            })
+    return response
+
+@app.get("/stream/{job_id}")
+async def stream_video(job_id: str, request: Request):
+    """The output as it is being encoded, for playback before the job finishes
+    
+    Needs fragmented MP4 output. The response follows the file as FFmpeg
+    writes it and ends when the job does; finished jobs are served like
+    /download.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    if job["status"] == "completed":
+        return await download_video(job_id, request)
+    if job["status"] in TERMINAL_STATUSES:
+        return JSONResponse({"error": f"Job is {job['status']}"}, status_code=409)
+    container = (job.get("plan") or {}).get("container", config.OUTPUT_CONTAINER)
+    if container != "fragmented":
+        return JSONResponse({"error": "Output is not fragmented MP4; use /download when it completes"}, status_code=409)
+    
+    output_path = OUTPUT_DIR / f"{job_id}.mp4"
+    
+    async def tail():
+        handle = None
+        try:
+            while not await request.is_disconnected():
+                # Check the status first so everything written before it finished gets read
+                job = get_job(job_id)
+                done = job is None or job["status"] in TERMINAL_STATUSES
+                if handle is None and output_path.exists():
+                    handle = open(output_path, "rb")
+                if handle is not None:
+                    while chunk := await asyncio.to_thread(handle.read, STREAM_CHUNK_BYTES):
+                        yield chunk
+                if done:
+                    return
+                await asyncio.sleep(STREAM_POLL_SECONDS)
+        finally:
+            if handle is not None:
+                handle.close()
+    
+    return StreamingResponse(tail(), media_type="video/mp4", headers={"Cache-Control": "no-cache"})
 
 @app.on_event("startup")
 async def startup():
-    print("🚀 Server started! Visit http://localhost:8000/docs for API docs")
+    scheduler.start()
+    recovered = recover_jobs(jobs, scheduler)
+    if recovered:
+        print(f"♻️  Re-queued {recovered} interrupted jobs")
+    # Leftovers of jobs that died with an earlier server, then regular sweeps
+    removed = await asyncio.to_thread(janitor.sweep, orphans=True)
+    if removed:
+        print(f"🧹 Removed {removed} expired or orphaned files")
+    if config.JANITOR_INTERVAL_SECONDS > 0:
+        janitor.start(config.JANITOR_INTERVAL_SECONDS)
+    print(f"🚀 Server started with {config.MAX_WORKERS} workers ({config.FFMPEG_THREADS} FFmpeg threads each)! Visit http://localhost:8000/docs for API docs")
+
+@app.on_event("shutdown")
+async def shutdown():
+    janitor.stop()
+    scheduler.stop()
+    jobs.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Histogram buckets (seconds) for pipeline stages, from a quick upload to a long encode
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Metric:
+    """Base for metrics rendered in the Prometheus text format"""
+
+    kind = "untyped"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._lock = threading.Lock()
+
+    def samples(self):
+        """(suffix, labels, value) tuples"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        super().__init__(name, help_text)
+        self._values = {}  # sorted label items -> value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+class Gauge(Metric):
+    """Gauge read from a callback at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, read):
+        super().__init__(name, help_text)
+        self.read = read
+
+    def samples(self):
+        return [("", (), self.read())]
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+        self._series = {}  # sorted label items -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    samples.append(("_bucket", key + (("le", f"{bound:g}"),), count))
+                samples.append(("_bucket", key + (("le", "+Inf"),), series[-1]))
+                samples.append(("_sum", key, series[-2]))
+                samples.append(("_count", key, series[-1]))
+        return samples
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "autocaption_stage_seconds", "Wall time of each job stage", STAGE_BUCKETS
+))
+FFMPEG_CPU_SECONDS = REGISTRY.register(Counter(
+    "autocaption_ffmpeg_cpu_seconds_total", "User plus system CPU time of FFmpeg children"
+))
+RASTERIZED_IMAGES = REGISTRY.register(Counter(
+    "autocaption_rasterized_images_total", "Caption images rendered"
+))
+RASTERIZED_BYTES = REGISTRY.register(Counter(
+    "autocaption_rasterized_bytes_total", "Bytes of caption images and subtitle files written"
+))
+JOBS_FINISHED = REGISTRY.register(Counter(
+    "autocaption_jobs_total", "Jobs that finished, by final status"
+))
+
+def files_bytes(paths):
+    """Total size of the files that exist among paths"""
+    total = 0
+    for path in set(paths):
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+class JobTimings:
+    """Per-stage timings of a job, kept on its record as "timings"
+
+    Each stage records its wall time plus whatever details the caller adds
+    to the dict it yields; the stage is also observed in STAGE_SECONDS.
+    """
+
+    def __init__(self, store, job_ids):
+        self.store = store
+        self.job_ids = job_ids
+        self.stages = dict((store.get(job_ids[0]) or {}).get("timings") or {})
+
+    @contextmanager
+    def stage(self, name):
+        details = {}
+        started = time.perf_counter()
+        try:
+            yield details
+        finally:
+            elapsed = time.perf_counter() - started
+            STAGE_SECONDS.observe(elapsed, stage=name)
+            self.stages[name] = {"seconds": round(elapsed, 3), **details}
+            for job_id in self.job_ids:
+                self.store.update(job_id, timings=self.stages)
+
+def record_captions(details, paths, images=None):
+    """Add the caption files a job wrote to its rasterize stage and the counters
+
+    images defaults to the number of files (ASS output is one text file and
+    no images).
+    """
+    paths = set(paths)
+    size = files_bytes(paths)
+    images = len(paths) if images is None else images
+    details.update(images=images, bytes=size)
+    RASTERIZED_IMAGES.inc(images)
+    RASTERIZED_BYTES.inc(size)
@@ -0,0 +1,167 @@
+import config
+
+# Output frame size per aspect ratio (anything else renders 16:9)
+TARGET_SIZES = {
+    "9:16": (720, 1280),
+    "16:9": (1280, 720),
+}
+
+# x264 presets from slowest to fastest; each load factor steps one faster
+PRESET_LADDER = ['medium', 'fast', 'faster', 'veryfast']
+CRF = 23
+
+# Audio codecs an MP4 can carry as-is; anything else is re-encoded to AAC
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3'}
+
+# MP4 layouts: "fragmented" writes self-contained ~2 s fragments as it goes,
+# so the file plays while it is still being encoded; "faststart" moves the
+# index to the front once the encode ends
+CONTAINER_ARGS = {
+    "fragmented": ['-movflags', '+frag_keyframe+empty_moov+default_base_moof', '-frag_duration', '2000000'],
+    "faststart": ['-movflags', '+faststart'],
+}
+
+def target_size(aspect_ratio):
+    return TARGET_SIZES.get(aspect_ratio, TARGET_SIZES["16:9"])
+
+def scale_pad_filter(aspect_ratio):
+    """Scale and pad filter for the requested aspect ratio"""
+    width, height = target_size(aspect_ratio)
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black"
+    )
+
+def display_size(media):
+    """Frame size after FFmpeg applies the rotation metadata"""
+    if media["rotation"] in (90, 270):
+        return media["height"], media["width"]
+    return media["width"], media["height"]
+
+def check_limits(media):
+    """Seconds to trim a source to (None to keep it whole)
+
+    Raises ValueError for sources that are rejected outright.
+    """
+    if not media["width"] or not media["height"]:
+        raise ValueError("No video stream found")
+    if media["width"] * media["height"] > config.MAX_SOURCE_PIXELS:
+        raise ValueError(f"Video resolution {media['width']}x{media['height']} is above the limit")
+    if media["duration"] is not None and media["duration"] > config.MAX_VIDEO_SECONDS:
+        if not config.TRIM_LONG_VIDEOS:
+            raise ValueError(f"Video is longer than {config.MAX_VIDEO_SECONDS} seconds")
+        return float(config.MAX_VIDEO_SECONDS)
+    return None
+
+def default_plan(aspect_ratios, ffmpeg_threads=None):
+    """The fixed pipeline used when the source couldn't be probed"""
+    return {
+        "source": None,
+        "filters": {aspect_ratio: scale_pad_filter(aspect_ratio) for aspect_ratio in aspect_ratios},
+        "preset": PRESET_LADDER[0],
+        "crf": CRF,
+        "decode_threads": ffmpeg_threads,
+        "encode_threads": ffmpeg_threads,
+        "audio": "copy",
+        "container": config.OUTPUT_CONTAINER,
+        "trim_seconds": None,
+        "duration": None,
+        "reasons": ["source could not be probed; using the default pipeline"],
+    }
+
+def plan_job(media, aspect_ratios, queue_depth=0, ffmpeg_threads=None):
+    """Choose filters, encoder preset, threads and audio handling for a job
+
+    media comes from probe.probe_media. The plan is JSON-serializable and
+    kept on the job record; reasons explains each choice.
+    """
+    if media is None:
+        return default_plan(aspect_ratios, ffmpeg_threads)
+
+    reasons = []
+    width, height = display_size(media)
+    if media["rotation"]:
+        reasons.append(f"rotated {media['rotation']} degrees: treated as {width}x{height}")
+
+    # Skip scale/pad when the source already has the output size
+    filters = {}
+    for aspect_ratio in aspect_ratios:
+        chain = []
+        if (width, height) == target_size(aspect_ratio):
+            reasons.append(f"{aspect_ratio}: source is already {width}x{height}, no scale/pad")
+        else:
+            chain.append(scale_pad_filter(aspect_ratio))
+        if media["pix_fmt"] != "yuv420p":
+            # Convert once up front so captions are overlaid in 8-bit 4:2:0
+            chain.append("format=yuv420p")
+        filters[aspect_ratio] = ",".join(chain) or "null"
+    if media["pix_fmt"] != "yuv420p":
+        reasons.append(f"pixel format {media['pix_fmt']} converted to yuv420p")
+
+    trim_seconds = check_limits(media)
+    duration = media["duration"]
+    if trim_seconds is not None:
+        reasons.append(f"trimmed from {duration:.1f}s to {trim_seconds:.0f}s")
+        duration = trim_seconds
+
+    # Trade compression for speed on long videos and when the queue backs up
+    level = 0
+    if duration is not None and duration > config.LONG_VIDEO_SECONDS:
+        level += 1
+        reasons.append(f"long video ({duration:.0f}s): faster preset")
+    if queue_depth >= config.MAX_WORKERS:
+        level += 1 + (queue_depth >= 3 * config.MAX_WORKERS)
+        reasons.append(f"{queue_depth} jobs queued: faster preset")
+    preset = PRESET_LADDER[min(level, len(PRESET_LADDER) - 1)]
+
+    # Decoding is the cost that grows with the source resolution
+    pixels = media["width"] * media["height"]
+    decode_threads = 2 if pixels <= 1280 * 720 else 4 if pixels <= 1920 * 1080 else 8
+    if ffmpeg_threads:
+        decode_threads = min(decode_threads, ffmpeg_threads)
+
+    if media["audio_codec"] is None:
+        audio = "none"
+    elif media["audio_codec"] in MP4_AUDIO_CODECS:
+        audio = "copy"
+    else:
+        audio = "aac"
+        reasons.append(f"audio {media['audio_codec']} re-encoded to AAC")
+
+    return {
+        "source": media,
+        "filters": filters,
+        "preset": preset,
+        "crf": CRF,
+        "decode_threads": decode_threads,
+        "encode_threads": ffmpeg_threads,
+        "audio": audio,
+        "container": config.OUTPUT_CONTAINER,
+        "trim_seconds": trim_seconds,
+        "duration": duration,
+        "reasons": reasons,
+    }
+
+def input_args(plan):
+    """Options for the source input (placed before its -i)"""
+    args = []
+    if plan["decode_threads"]:
+        args.extend(['-threads', str(plan["decode_threads"])])
+    if plan["trim_seconds"] is not None:
+        args.extend(['-t', f"{plan['trim_seconds']:.3f}"])
+    return args
+
+def video_encode_args(plan):
+    return ['-c:v', 'libx264', '-preset', plan["preset"], '-crf', str(plan["crf"]), '-pix_fmt', 'yuv420p']
+
+def audio_encode_args(plan):
+    if plan["audio"] == "aac":
+        return ['-c:a', 'aac', '-b:a', '128k']
+    return ['-c:a', 'copy']
+
+def container_args(plan):
+    return CONTAINER_ARGS.get(plan["container"], CONTAINER_ARGS["faststart"])
+
+def encode_args(plan):
+    """Output codec and container options for one rendered video"""
+    return video_encode_args(plan) + audio_encode_args(plan) + container_args(plan)
@@ -0,0 +1,64 @@
+import asyncio
+import io
+
+from PIL import Image
+
+import config
+from ffmpeg_runner import run_ffmpeg_async
+from processor import TEMPLATES, get_base_filter, load_template_font, render_styled_text_image
+from timeline import compile_timeline
+
+# Encoder settings for the returned still
+PREVIEW_FORMATS = {
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 90}),
+    "png": ("PNG", "image/png", {}),
+}
+
+def build_frame_command(video_path, timestamp, base_filter):
+    """Decode the single frame at timestamp, scaled like the export"""
+    # Input seeking jumps to the keyframe before timestamp and decodes forward
+    return [
+        'ffmpeg', '-v', 'error',
+        '-ss', f"{timestamp:.3f}", '-i', str(video_path),
+        '-frames:v', '1', '-vf', base_filter,
+        '-f', 'image2pipe', '-c:v', 'ppm', 'pipe:1',
+    ]
+
+async def extract_frame(video_path, timestamp, base_filter):
+    """The frame at timestamp as an RGB image"""
+    result = await run_ffmpeg_async(
+        build_frame_command(video_path, timestamp, base_filter),
+        capture_stdout=True, timeout=config.PREVIEW_TIMEOUT_SECONDS, nice=0
+    )
+    if not result.ok or not result.stdout:
+        raise ValueError(f"No frame at {timestamp:.3f}s ({result.reason}): {result.stderr[-300:]}")
+    return Image.open(io.BytesIO(result.stdout)).convert('RGB')
+
+def compose_preview(frame, timeline, style, timestamp, pil_format, save_args):
+    """Paste the caption active at timestamp onto frame and encode it"""
+    active = timeline.at(timestamp)
+    if active is not None:
+        seg_idx, highlight_idx = active
+        words = timeline.segments[seg_idx]
+        caption = render_styled_text_image(
+            ' '.join(w['word'] for w in words), load_template_font(style),
+            highlight_idx, words, style
+        )
+        # Same placement as the export's overlay filter
+        position = ((frame.width - caption.width) // 2, frame.height - caption.height - 100)
+        frame.paste(caption, position, caption)
+
+    output = io.BytesIO()
+    frame.save(output, pil_format, **save_args)
+    return output.getvalue()
+
+async def render_preview(video_path, captions, template, aspect_ratio, timestamp, image_format="jpeg"):
+    """One output frame with the caption active at timestamp; returns (bytes, media type)"""
+    pil_format, media_type, save_args = PREVIEW_FORMATS[image_format]
+    style = TEMPLATES.get(template, TEMPLATES["classic"])
+
+    timeline = compile_timeline(captions)
+    frame = await extract_frame(video_path, timestamp, get_base_filter(aspect_ratio))
+    # Rendering text and encoding the still are CPU work: keep them off the event loop
+    content = await asyncio.to_thread(compose_preview, frame, timeline, style, timestamp, pil_format, save_args)
+    return content, media_type
@@ -0,0 +1,84 @@
+import json
+import subprocess
+
+def ffprobe(path, *args):
+    """Run ffprobe with JSON output; returns the parsed result"""
+    cmd = ['ffprobe', '-v', 'error', '-of', 'json', *args, str(path)]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ValueError(f"ffprobe failed: {result.stderr.strip()[-500:]}")
+    return json.loads(result.stdout or "{}")
+
+def probe_duration(path):
+    """Container duration in seconds, or None if it can't be read"""
+    try:
+        info = ffprobe(path, '-show_entries', 'format=duration')
+        return float(info["format"]["duration"])
+    except (ValueError, KeyError, OSError):
+        return None
+
+def probe_keyframes(path):
+    """Timestamps (seconds) of the video keyframes, read from packet flags"""
+    info = ffprobe(
+        path, '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags'
+    )
+    keyframes = []
+    for packet in info.get("packets", []):
+        if 'K' in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A"):
+            keyframes.append(float(packet["pts_time"]))
+    return sorted(keyframes)
+
+def parse_rate(rate):
+    """FFprobe rational frame rate ("30000/1001") as a float, or None"""
+    try:
+        num, _, den = str(rate).partition('/')
+        value = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+    return value or None
+
+def probe_media(path):
+    """What the planner needs to know about a source, or None if unreadable
+
+    Returns duration, the first video stream's size, pixel format, codec,
+    frame rate and rotation (degrees, from the display matrix or the old
+    rotate tag), and the first audio stream's codec (None without audio).
+    """
+    try:
+        info = ffprobe(
+            path,
+            '-show_entries',
+            'format=duration:stream=codec_type,codec_name,width,height,pix_fmt,avg_frame_rate'
+            ':stream_tags=rotate:stream_side_data=rotation',
+        )
+    except (ValueError, OSError):
+        return None
+
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+
+    try:
+        duration = float(info["format"]["duration"])
+    except (KeyError, ValueError):
+        duration = None
+
+    rotation = 0
+    if video is not None:
+        for side_data in video.get("side_data_list", []):
+            if "rotation" in side_data:
+                rotation = int(side_data["rotation"])
+        if not rotation and "rotate" in video.get("tags", {}):
+            rotation = int(video["tags"]["rotate"])
+
+    return {
+        "duration": duration,
+        "width": video.get("width") if video else None,
+        "height": video.get("height") if video else None,
+        "pix_fmt": video.get("pix_fmt") if video else None,
+        "video_codec": video.get("codec_name") if video else None,
+        "fps": parse_rate(video.get("avg_frame_rate")) if video else None,
+        "rotation": rotation % 360,
+        "audio_codec": audio.get("codec_name") if audio else None,
+    }
@@ -1,7 +1,16 @@
-import subprocess
 import os
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from collections import OrderedDict
+from PIL import Image, ImageDraw
 from pathlib import Path
+import config
+from ass_renderer import create_ass_subtitles
+from effects import GLOW_SPREAD, draw_glow, draw_stroked_text
+from fonts import FONTS
+from ffmpeg_runner import run_ffmpeg
+from metrics import JobTimings, record_captions
+from planner import encode_args, input_args, plan_job, scale_pad_filter
+from probe import probe_media
+from timeline import compile_timeline
 
 # Professional Caption Templates (CapCut-style)
 TEMPLATES = {
@@ -65,212 +74,604 @@ TEMPLATES = {
     }
 }
 
-def create_caption_images_with_template(captions, output_dir, template="classic"):
-    """Create caption images using specified template"""
+# Vertical offset of the caption text inside its image
+CAPTION_TEXT_Y = 45
+
+# Rendered segments render_timeline_frames keeps for their later events
+SEGMENT_CACHE_SIZE = 2
+
+def load_template_font(style):
+    """Caption font for a template style (its own "font" path, if set)"""
+    return FONTS.get(style["font_size"], style.get("font"))
+
+def render_timeline_frames(timeline, template="classic"):
+    """Yield (name, image, start, end) for every event of a caption timeline"""
     style = TEMPLATES.get(template, TEMPLATES["classic"])
-    overlay_data = []
+    font = load_template_font(style)
     
-    # Load font
-    try:
-        font = ImageFont.truetype("/System/Library/Fonts/Supplemental/Arial Bold.ttf", style["font_size"])
-    except:
-        try:
-            font = ImageFont.truetype("/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf", style["font_size"])
-        except:
-            font = ImageFont.load_default()
-    
-    # Process each caption segment
-    for seg_idx, caption in enumerate(captions):
-        words = caption.get('words', [])
-        if not words:
-            continue
-        
-        full_text = ' '.join([w['word'] for w in words])
+    # Lay out and draw each segment once, then patch in each highlight. Events
+    # are in time order, so a segment's events come together: only the last
+    # few segments are kept (overlapping captions can interleave)
+    segments = OrderedDict()
+    for start, end, seg_idx, word_idx in timeline.events():
+        if seg_idx in segments:
+            segments.move_to_end(seg_idx)
+        else:
+            segments[seg_idx] = render_caption_segment(timeline.segments[seg_idx], font, style)
+            if len(segments) > SEGMENT_CACHE_SIZE:
+                segments.popitem(last=False)
+        img = render_segment_highlight(segments[seg_idx], word_idx)
+        yield f"seg_{seg_idx}_w_{word_idx}.png", img, start, end
+
+def create_caption_images_with_template(timeline, output_dir, template="classic"):
+    """Create caption images using specified template"""
+    overlay_data = []
+    for name, img, start, end in render_timeline_frames(timeline, template):
+        img_path = Path(output_dir) / name
+        img.save(img_path, 'PNG')
         
-        # Create highlighted versions for each word
-        for word_idx, word_data in enumerate(words):
-            img_path = create_styled_text_image(
-                full_text, font, output_dir, 
-                f"seg_{seg_idx}_w_{word_idx}",
-                highlight_idx=word_idx,
-                words_list=words,
-                style=style
-            )
-            
-            overlay_data.append({
-                'path': img_path,
-                'start': word_data['start'],
-                'end': word_data['end'],
-            })
+        overlay_data.append({
+            'path': str(img_path),
+            'start': start,
+            'end': end,
+        })
     
     return overlay_data
 
 def create_styled_text_image(text, font, output_dir, name, highlight_idx=-1, words_list=None, style=None):
     """Create a caption image with applied template style"""
+    img = render_styled_text_image(text, font, highlight_idx, words_list, style)
+    
+    # Save
+    img_path = Path(output_dir) / f"{name}.png"
+    img.save(img_path, 'PNG')
+    return str(img_path)
+
+def render_styled_text_image(text, font, highlight_idx=-1, words_list=None, style=None):
+    """Render a caption image in memory with applied template style"""
     if style is None:
         style = TEMPLATES["classic"]
     
-    # Measure text
-    dummy_img = Image.new('RGBA', (1, 1))
-    dummy_draw = ImageDraw.Draw(dummy_img)
-    
+    words = [{'word': w} for w in text.split()] if words_list is None else words_list
+    segment = render_caption_segment(words, font, style)
+    return render_segment_highlight(segment, highlight_idx)
+
+def layout_caption_segment(words, font, style):
+    """Measure every word of a segment once"""
     # Calculate positions for each word
-    words = text.split() if words_list is None else [w['word'] for w in words_list]
     word_positions = []
+    ink_extents = []
     x_offset = style["padding"]
     
-    for i, word in enumerate(words):
-        bbox = dummy_draw.textbbox((0, 0), word + ' ', font=font)
+    # Stroke and glow spread ink past the glyph box (plus antialiasing)
+    spread = style["stroke_width"] + (GLOW_SPREAD if style.get("has_glow", False) else 0) + 2
+    
+    for word in words:
+        bbox = FONTS.bbox(font, word + ' ')
         word_width = bbox[2] - bbox[0]
         word_positions.append((x_offset, word_width, word))
+        ink_extents.append((x_offset + bbox[0] - spread, x_offset + bbox[2] + spread))
         x_offset += word_width
     
-    # Calculate image size
-    total_width = x_offset + style["padding"]
-    total_height = 130 + (style["padding"] // 2)
-    
-    # Create image
-    img = Image.new('RGBA', (total_width, total_height), (0, 0, 0, 0))
-    draw = ImageDraw.Draw(img)
-    
-    # Draw background if needed
+    return {
+        'positions': word_positions,
+        'ink': ink_extents,
+        'width': x_offset + style["padding"],
+        'height': 130 + (style["padding"] // 2),
+    }
+
+def draw_caption_background(draw, width, height, style):
+    """Draw the template background box if it has one"""
     if style["bg_color"][3] > 0:  # If not fully transparent
         if style["radius"] > 0:
             draw.rounded_rectangle(
-                [(0, 0), (total_width, total_height)],
+                [(0, 0), (width, height)],
                 radius=style["radius"],
                 fill=style["bg_color"]
             )
         else:
             draw.rectangle(
-                [(0, 0), (total_width, total_height)],
+                [(0, 0), (width, height)],
                 fill=style["bg_color"]
             )
+
+def draw_caption_word(img, draw, x_pos, y_pos, word, font, style, is_highlighted):
+    """Draw one word with the template's glow, stroke and fill"""
+    color = style["highlight_color"] if is_highlighted else style["text_color"]
     
-    y_pos = 45
+    # Add glow effect for highlighted words if template supports it
+    if is_highlighted and style.get("has_glow", False):
+        glow_color = style.get("glow_color", style["highlight_color"])
+        draw_glow(img, (x_pos, y_pos), word + ' ', font, glow_color)
     
-    # Draw each word
-    for i, (x_pos, width, word) in enumerate(word_positions):
-        is_highlighted = (i == highlight_idx)
-        color = style["highlight_color"] if is_highlighted else style["text_color"]
-        
-        # Add glow effect for highlighted words if template supports it
-        if is_highlighted and style.get("has_glow", False):
-            glow_color = style.get("glow_color", style["highlight_color"])
-            # Multiple glow layers for intensity
-            for offset in [6, 4, 2]:
-                draw.text((x_pos + offset, y_pos + offset), word + ' ', font=font, fill=(*glow_color[:3], glow_color[3] // 2))
-                draw.text((x_pos - offset, y_pos - offset), word + ' ', font=font, fill=(*glow_color[:3], glow_color[3] // 2))
+    # Draw text (with native stroke if the template has one)
+    draw_stroked_text(
+        draw, (x_pos, y_pos), word + ' ', font, color,
+        style["stroke_width"], style.get("stroke_color", (0, 0, 0, 255))
+    )
+
+def render_caption_segment(words, font, style):
+    """Render a segment once: background plus every word un-highlighted"""
+    layout = layout_caption_segment([w['word'] for w in words], font, style)
+    width, height = layout['width'], layout['height']
+    
+    background = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    draw_caption_background(ImageDraw.Draw(background), width, height, style)
+    
+    base = background.copy()
+    draw = ImageDraw.Draw(base)
+    for x_pos, _, word in layout['positions']:
+        draw_caption_word(base, draw, x_pos, CAPTION_TEXT_Y, word, font, style, False)
+    
+    return {
+        'layout': layout,
+        'background': background,
+        'base': base,
+        'font': font,
+        'style': style,
+    }
+
+def render_segment_highlight(segment, highlight_idx):
+    """Copy of the segment base with one word re-drawn as a highlighted patch"""
+    img = segment['base'].copy()
+    layout = segment['layout']
+    if not 0 <= highlight_idx < len(layout['positions']):
+        return img
+    
+    ink_left, ink_right = layout['ink'][highlight_idx]
+    left = max(0, ink_left)
+    right = min(layout['width'], ink_right)
+    
+    # Rebuild the patch from the bare background, redrawing (in order) every
+    # word whose ink can reach it so it matches a full render exactly
+    patch = segment['background'].crop((left, 0, right, layout['height']))
+    draw = ImageDraw.Draw(patch)
+    for i, (word_x, _, word) in enumerate(layout['positions']):
+        if layout['ink'][i][1] <= left or layout['ink'][i][0] >= right:
+            continue
+        draw_caption_word(
+            patch, draw, word_x - left, CAPTION_TEXT_Y, word,
+            segment['font'], segment['style'], i == highlight_idx
+        )
+    
+    img.paste(patch, (left, 0))
+    return img
+
+# Transparent frame a caption track shows between captions
+BLANK_FRAME = "blank.png"
+
+def caption_canvas_size(timeline, template="classic"):
+    """Size of the largest caption frame, from layout alone (nothing is drawn)"""
+    style = TEMPLATES.get(template, TEMPLATES["classic"])
+    font = load_template_font(style)
+    layouts = [
+        layout_caption_segment([w['word'] for w in timeline.segments[seg_idx]], font, style)
+        for seg_idx in sorted(set(timeline.seg_idx))
+    ]
+    return max(l['width'] for l in layouts), max(l['height'] for l in layouts)
+
+def create_caption_track(timeline, output_dir, template="classic"):
+    """Create a single caption track (ffconcat list of equally sized frames)"""
+    if not len(timeline):
+        return None
+    
+    # Pad every frame onto one shared canvas so the track has a fixed size;
+    # frames are saved as they are drawn, so only one is held at a time
+    canvas_width, canvas_height = caption_canvas_size(timeline, template)
+    
+    # Timeline events are already sorted and non-overlapping
+    events = []
+    for name, img, start, end in render_timeline_frames(timeline, template):
+        if img.size != (canvas_width, canvas_height):
+            canvas = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0))
+            canvas.paste(img, ((canvas_width - img.width) // 2, canvas_height - img.height))
+            img = canvas
+        path = Path(output_dir) / name
+        img.save(path, 'PNG')
+        events.append((start, end, str(path)))
+    
+    blank_path = Path(output_dir) / BLANK_FRAME
+    Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0)).save(blank_path, 'PNG')
+    
+    track = {
+        'events': events,
+        'blank': str(blank_path),
+        'frames': len(events),
+    }
+    track['path'] = write_caption_track_list(track, Path(output_dir) / "captions.ffconcat")
+    return track
+
+def caption_track_files(track):
+    """Every file a caption track wrote (none for an empty track)"""
+    if not track:
+        return []
+    return [path for _, _, path in track['events']] + [track['blank'], track['path']]
+
+def write_caption_track_list(track, list_path, window_start=0.0, window_end=None):
+    """Write the ffconcat list for a caption track
+    
+    With a window, only frames visible in [window_start, window_end) are
+    listed and their times are rebased so the list starts at 0.
+    """
+    blank_path = track['blank']
+    
+    # Lay frames out back to back, filling gaps with the blank frame
+    entries = []
+    current_time = window_start
+    for start_time, end_time, path in track['events']:
+        if window_end is not None:
+            if start_time >= window_end:
+                break
+            end_time = min(end_time, window_end)
+        if end_time <= current_time:
+            continue
+        if start_time > current_time:
+            entries.append((blank_path, start_time - current_time))
+            current_time = start_time
+        entries.append((path, end_time - current_time))
+        current_time = end_time
+    entries.append((blank_path, 0.04))
+    
+    # Absolute paths (read with -safe 0) so windowed lists can live anywhere
+    lines = ["ffconcat version 1.0"]
+    for path, duration in entries:
+        lines.append(f"file '{Path(path).resolve()}'")
+        lines.append(f"duration {duration:.3f}")
+    # The concat demuxer ignores the last duration unless the file is repeated
+    lines.append(f"file '{Path(blank_path).resolve()}'")
+    
+    Path(list_path).write_text("\n".join(lines) + "\n")
+    return str(list_path)
+
+def get_base_filter(aspect_ratio):
+    """Scale and pad filter for the requested aspect ratio"""
+    return scale_pad_filter(aspect_ratio)
+
+def build_overlay_chain_command(video_path, overlay_data, base_filter):
+    """Legacy graph: one input and one chained overlay per caption image"""
+    filter_complex = f"[0:v]{base_filter}[base];"
+    
+    current_label = "base"
+    overlay_idx = 1
+    
+    # Add ALL overlays with strict timing
+    for i, overlay in enumerate(overlay_data):
+        start_time = overlay['start']
+        end_time = overlay['end']
         
-        # Draw text with stroke if needed
-        if style["stroke_width"] > 0:
-            stroke_color = style.get("stroke_color", (0, 0, 0, 255))
-            # Draw stroke
-            for adj_x in range(-style["stroke_width"], style["stroke_width"] + 1):
-                for adj_y in range(-style["stroke_width"], style["stroke_width"] + 1):
-                    if adj_x != 0 or adj_y != 0:
-                        draw.text((x_pos + adj_x, y_pos + adj_y), word + ' ', font=font, fill=stroke_color)
+        next_label = f"v{i}" if i < len(overlay_data) - 1 else "out"
         
-        # Draw main text
-        draw.text((x_pos, y_pos), word + ' ', font=font, fill=color)
+        filter_complex += f"[{current_label}][{overlay_idx}:v]overlay=(main_w-overlay_w)/2:main_h-overlay_h-100:enable='between(t,{start_time},{end_time})'[{next_label}];"
+        current_label = next_label
+        overlay_idx += 1
     
-    # Save
-    img_path = Path(output_dir) / f"{name}.png"
-    img.save(img_path, 'PNG')
-    return str(img_path)
+    if not overlay_data:
+        filter_complex = f"[0:v]{base_filter}[out]"
+    
+    filter_complex = filter_complex.rstrip(';')
+    
+    ffmpeg_cmd = ['ffmpeg', '-i', video_path]
+    
+    for overlay in overlay_data:
+        ffmpeg_cmd.extend(['-i', overlay['path']])
+    
+    ffmpeg_cmd.extend(['-filter_complex', filter_complex])
+    return ffmpeg_cmd
+
+def build_caption_track_command(video_path, track, base_filter):
+    """Single overlay of one pre-composited caption track"""
+    ffmpeg_cmd = ['ffmpeg', '-i', video_path]
+    
+    if track is None:
+        filter_complex = f"[0:v]{base_filter}[out]"
+    else:
+        ffmpeg_cmd.extend(['-f', 'concat', '-safe', '0', '-i', track['path']])
+        filter_complex = (
+            f"[0:v]{base_filter}[base];"
+            f"[base][1:v]overlay=(main_w-overlay_w)/2:main_h-overlay_h-100:eof_action=pass[out]"
+        )
+    
+    ffmpeg_cmd.extend(['-filter_complex', filter_complex])
+    return ffmpeg_cmd
 
-def parse_time_to_seconds(time_str):
-    """Convert MM:SS:mmm to seconds"""
-    parts = time_str.split(':')
-    if len(parts) == 3:
-        minutes = int(parts[0])
-        seconds = int(parts[1])
-        milliseconds = int(parts[2])
-        return minutes * 60 + seconds + milliseconds / 1000.0
-    return 0.0
-
-def process_video(video_path, captions, aspect_ratio, output_path, job_id, jobs, template="classic"):
-    """Process video with captions using specified template"""
+def build_ass_command(video_path, subtitles, base_filter):
+    """Burn an ASS subtitle file in with libass in the same filter pass"""
+    filter_complex = f"[0:v]{base_filter},ass=filename={subtitles['path']}[out]"
+    return ['ffmpeg', '-i', video_path, '-filter_complex', filter_complex]
+
+# Output encoding shared by every render path
+def thread_args(ffmpeg_threads):
+    """Encoder and filter thread caps for one output"""
+    if not ffmpeg_threads:
+        return []
+    return ['-threads', str(ffmpeg_threads), '-filter_threads', str(ffmpeg_threads)]
+
+def check_ffmpeg_result(result, store, job_ids):
+    """Record a failed FFmpeg run's diagnostics on the jobs and raise"""
+    if result.ok:
+        return
+    print(f"FFmpeg error ({result.reason}): {result.stderr[-1000:]}")
+    for job_id in job_ids:
+        store.update(job_id, ffmpeg=result.diagnostics())
+    raise Exception(f"FFmpeg failed ({result.reason}): {result.stderr[-500:]}")
+
+def remux_faststart(output_paths, store, job_ids, on_spawn=None):
+    """Rewrite fragmented outputs as faststart MP4s for download; returns CPU seconds
+    
+    Fragmented MP4 plays while it is encoded (/stream) but has no duration
+    in its moov and seeks poorly in many players. The remux copies the
+    streams; readers still tailing the fragmented file keep it until they
+    close it.
+    """
+    cpu_seconds = []
+    for output_path in output_paths:
+        remuxed = Path(output_path).with_suffix('.remux.mp4')
+        result = run_ffmpeg(
+            ['ffmpeg', '-i', str(output_path), '-map', '0', '-c', 'copy', '-movflags', '+faststart', '-y', str(remuxed)],
+            on_spawn
+        )
+        if not result.ok:
+            remuxed.unlink(missing_ok=True)
+        check_ffmpeg_result(result, store, job_ids)
+        os.replace(remuxed, output_path)
+        cpu_seconds.append(result.cpu_seconds)
+    return None if None in cpu_seconds else round(sum(cpu_seconds), 3)
+
+def record_failure(store, job_ids, error, is_cancelled=None):
+    """Mark jobs failed; returns True if they were cancelled instead
+    
+    A cancel kills FFmpeg, which surfaces here as an FFmpeg failure, so
+    is_cancelled is checked first: watchers must see "cancelled", never a
+    "failed" that turns into it later.
+    """
+    cancelled = is_cancelled is not None and is_cancelled()
+    for job_id in job_ids:
+        if cancelled:
+            store.update(job_id, status="cancelled", error=None)
+        else:
+            store.update(job_id, status="failed", error=str(error))
+    return cancelled
+
+def parse_ffmpeg_progress(block):
+    """(encoded seconds, fps, speed) from one FFmpeg -progress block"""
+    def number(value):
+        try:
+            return float(value.rstrip('x'))
+        except (AttributeError, ValueError):
+            return None
+    
+    # out_time_ms is microseconds too (a long-standing FFmpeg quirk)
+    out_time = number(block.get('out_time_us') or block.get('out_time_ms'))
+    encoded = out_time / 1_000_000 if out_time is not None else None
+    return encoded, number(block.get('fps')), number(block.get('speed'))
+
+def report_encode_progress(store, job_id, duration, encoded, fps, speed, start=50, end=99):
+    """Map encoded seconds onto the job's progress range, with fps and ETA"""
+    if not duration or encoded is None:
+        return
+    fraction = min(max(encoded / duration, 0.0), 1.0)
+    store.update(
+        job_id,
+        progress=start + int((end - start) * fraction),
+        encoded_seconds=round(encoded, 2),
+        fps=fps,
+        speed=speed,
+        eta_seconds=round((duration - encoded) / speed, 1) if speed else None,
+    )
+
+def encode_progress_reporter(store, job_ids, duration):
+    """on_progress callback for a single FFmpeg run covering the whole video"""
+    def on_progress(block):
+        encoded, fps, speed = parse_ffmpeg_progress(block)
+        for job_id in job_ids:
+            report_encode_progress(store, job_id, duration, encoded, fps, speed)
+    return on_progress
+
+def process_video(video_path, captions, aspect_ratio, output_path, job_id, store, template="classic", render_mode="track", engine="pillow", ffmpeg_threads=None, on_spawn=None, media=None, queue_depth=0, is_cancelled=None):
+    """Process video with captions using specified template
+    
+    engine "pillow" rasterizes captions to PNG; render_mode "track" overlays
+    them as one pre-composited stream, "overlays" keeps the legacy
+    one-input-per-word graph. engine "ass" compiles captions to an ASS file
+    and burns it in with libass instead. ffmpeg_threads caps the encoder's
+    thread count; on_spawn receives the FFmpeg process (for cancellation).
+    The pipeline is planned from media (probe.probe_media; probed here if
+    not given) and queue_depth, and the plan is recorded on the job.
+    """
     try:
-        jobs[job_id]["status"] = "processing"
-        jobs[job_id]["progress"] = 10
+        store.update(job_id, status="processing", progress=10)
         
         # Create temp directory
-        temp_dir = Path("temp") / job_id
+        temp_dir = Path(config.SCRATCH_DIR) / job_id
         temp_dir.mkdir(parents=True, exist_ok=True)
         
+        plan = plan_job(media or probe_media(video_path), [aspect_ratio], queue_depth, ffmpeg_threads)
+        store.update(job_id, plan=plan)
+        base_filter = plan['filters'][aspect_ratio]
+        timeline = compile_timeline(captions)
+        timings = JobTimings(store, [job_id])
+        
         # Create caption images with template
-        jobs[job_id]["progress"] = 30
-        overlay_data = create_caption_images_with_template(captions, temp_dir, template)
+        store.update(job_id, progress=30)
+        with timings.stage("rasterize") as stage:
+            if engine == "ass":
+                subtitles = create_ass_subtitles(timeline, temp_dir / "captions.ass", template, aspect_ratio)
+                record_captions(stage, [subtitles['path']], images=0)
+                overlay_count = subtitles['events']
+                render_mode = "ass"
+            elif render_mode == "overlays":
+                overlay_data = create_caption_images_with_template(timeline, temp_dir, template)
+                record_captions(stage, [overlay['path'] for overlay in overlay_data])
+                overlay_count = len(overlay_data)
+            else:
+                track = create_caption_track(timeline, temp_dir, template)
+                overlay_count = track['frames'] if track else 0
+                record_captions(stage, caption_track_files(track), images=overlay_count)
+        store.update(job_id, progress=50)
         
-        # Build FFmpeg command
-        jobs[job_id]["progress"] = 50
+        print(f"Processing with template: {TEMPLATES.get(template, TEMPLATES['classic'])['name']}")
+        print(f"Created {overlay_count} caption frames ({render_mode} mode)")
         
-        # Base filter for aspect ratio
-        if aspect_ratio == "9:16":
-            base_filter = "scale=720:1280:force_original_aspect_ratio=decrease,pad=720:1280:(ow-iw)/2:(oh-ih)/2:color=black"
-        else:
-            base_filter = "scale=1280:720:force_original_aspect_ratio=decrease,pad=1280:720:(ow-iw)/2:(oh-ih)/2:color=black"
+        with timings.stage("graph"):
+            if engine == "ass":
+                ffmpeg_cmd = build_ass_command(video_path, subtitles, base_filter)
+            elif render_mode == "overlays":
+                ffmpeg_cmd = build_overlay_chain_command(video_path, overlay_data, base_filter)
+            else:
+                ffmpeg_cmd = build_caption_track_command(video_path, track, base_filter)
+            # Every builder puts the source first, so its input options go up front
+            ffmpeg_cmd[1:1] = input_args(plan)
+            ffmpeg_cmd.extend(['-map', '[out]', '-map', '0:a?', *encode_args(plan)])
+            ffmpeg_cmd.extend(thread_args(plan['encode_threads']))
+            ffmpeg_cmd.extend(['-y', output_path])
         
-        # Build filter with all overlays
-        filter_complex = f"[0:v]{base_filter}[base];"
+        # Execute FFmpeg
+        with timings.stage("ffmpeg") as stage:
+            result = run_ffmpeg(ffmpeg_cmd, on_spawn, encode_progress_reporter(store, [job_id], plan['duration']))
+            stage['cpu_seconds'] = result.cpu_seconds
         
-        current_label = "base"
-        overlay_idx = 1
+        check_ffmpeg_result(result, store, [job_id])
+        if plan['container'] == "fragmented":
+            with timings.stage("remux") as stage:
+                stage['cpu_seconds'] = remux_faststart([output_path], store, [job_id], on_spawn)
         
-        # Add ALL overlays with strict timing
-        for i, overlay in enumerate(overlay_data):
-            start_time = parse_time_to_seconds(overlay['start'])
-            end_time = parse_time_to_seconds(overlay['end'])
-            
-            next_label = f"v{i}" if i < len(overlay_data) - 1 else "out"
-            
-            filter_complex += f"[{current_label}][{overlay_idx}:v]overlay=(main_w-overlay_w)/2:main_h-overlay_h-100:enable='between(t,{start_time},{end_time})'[{next_label}];"
-            current_label = next_label
-            overlay_idx += 1
+        # Cleanup
+        with timings.stage("cleanup"):
+            import shutil
+            shutil.rmtree(temp_dir)
+            os.remove(video_path)
         
-        filter_complex = filter_complex.rstrip(';')
+        store.update(job_id, status="completed", progress=100, eta_seconds=0)
         
-        print(f"Processing with template: {TEMPLATES.get(template, TEMPLATES['classic'])['name']}")
-        print(f"Created {len(overlay_data)} overlays")
+    except Exception as e:
+        if record_failure(store, [job_id], e, is_cancelled):
+            return
+        print(f"Error processing video: {e}")
+        import traceback
+        traceback.print_exc()
+
+def build_batch_command(video_path, timeline, variants, temp_dir, engine="pillow", plan=None):
+    """One FFmpeg graph that decodes once and renders every variant
+    
+    The source is decoded once, split per aspect ratio, scaled/padded once
+    per aspect ratio and split again per template; each branch gets that
+    template's captions and is mapped to its own output.
+    """
+    ffmpeg_cmd = ['ffmpeg', *(input_args(plan) if plan else []), '-i', video_path]
+    filters = []
+    
+    aspect_ratios = list(dict.fromkeys(v['aspect_ratio'] for v in variants))
+    if len(aspect_ratios) > 1:
+        filters.append("[0:v]split=" + str(len(aspect_ratios)) + "".join(f"[src{i}]" for i in range(len(aspect_ratios))))
+        sources = [f"src{i}" for i in range(len(aspect_ratios))]
+    else:
+        sources = ["0:v"]
+    
+    base_labels = {}
+    for ar_idx, aspect_ratio in enumerate(aspect_ratios):
+        members = [i for i, v in enumerate(variants) if v['aspect_ratio'] == aspect_ratio]
+        base_filter = plan['filters'][aspect_ratio] if plan else get_base_filter(aspect_ratio)
+        chain = f"[{sources[ar_idx]}]{base_filter}"
+        if len(members) > 1:
+            chain += f",split={len(members)}"
+        for i in members:
+            chain += f"[base{i}]"
+            base_labels[i] = f"base{i}"
+        filters.append(chain)
+    
+    tracks = {}
+    input_idx = 1
+    for i, variant in enumerate(variants):
+        template = variant['template']
+        if engine == "ass":
+            subtitles = create_ass_subtitles(timeline, temp_dir / f"captions_{i}.ass", template, variant['aspect_ratio'])
+            filters.append(f"[{base_labels[i]}]ass=filename={subtitles['path']}[out{i}]")
+            continue
         
-        # Build FFmpeg command
-        ffmpeg_cmd = ['ffmpeg', '-i', video_path]
+        # Caption images don't depend on the aspect ratio; render once per template
+        if template not in tracks:
+            track_dir = temp_dir / f"track_{len(tracks)}"
+            track_dir.mkdir(parents=True, exist_ok=True)
+            tracks[template] = create_caption_track(timeline, track_dir, template)
+        track = tracks[template]
+        if track is None:
+            filters.append(f"[{base_labels[i]}]null[out{i}]")
+            continue
+        ffmpeg_cmd.extend(['-f', 'concat', '-safe', '0', '-i', track['path']])
+        filters.append(
+            f"[{base_labels[i]}][{input_idx}:v]overlay=(main_w-overlay_w)/2:main_h-overlay_h-100:eof_action=pass[out{i}]"
+        )
+        input_idx += 1
+    
+    ffmpeg_cmd.extend(['-filter_complex', ';'.join(filters)])
+    return ffmpeg_cmd
+
+def process_video_batch(video_path, captions, variants, job_id, store, engine="pillow", ffmpeg_threads=None, on_spawn=None, media=None, queue_depth=0, is_cancelled=None):
+    """Render several template/aspect-ratio variants in one FFmpeg run
+    
+    variants is a list of dicts with job_id, template, aspect_ratio and
+    output_path; each variant's job is updated along with the batch job.
+    """
+    variant_ids = [v['job_id'] for v in variants]
+    try:
+        store.update(job_id, status="processing", progress=10)
+        for variant_id in variant_ids:
+            store.update(variant_id, status="processing", progress=10)
         
-        for overlay in overlay_data:
-            ffmpeg_cmd.extend(['-i', overlay['path']])
+        # Create temp directory
+        temp_dir = Path(config.SCRATCH_DIR) / job_id
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        
+        aspect_ratios = list(dict.fromkeys(v['aspect_ratio'] for v in variants))
+        plan = plan_job(media or probe_media(video_path), aspect_ratios, queue_depth, ffmpeg_threads)
+        for plan_job_id in [job_id, *variant_ids]:
+            store.update(plan_job_id, plan=plan)
         
-        ffmpeg_cmd.extend([
-            '-filter_complex', filter_complex,
-            '-map', '[out]',
-            '-map', '0:a?',
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '23',
-            '-pix_fmt', 'yuv420p',
-            '-c:a', 'copy',
-            '-y', output_path
-        ])
+        timings = JobTimings(store, [job_id, *variant_ids])
+        store.update(job_id, progress=30)
+        # Captions are rendered while the batch graph is assembled
+        with timings.stage("rasterize") as stage:
+            ffmpeg_cmd = build_batch_command(video_path, compile_timeline(captions), variants, temp_dir, engine, plan)
+            written = [path for path in temp_dir.rglob('*') if path.is_file()]
+            # Caption frames only: not the blank frames or the concat/subtitle files
+            images = sum(1 for path in written if path.suffix == '.png' and path.name != BLANK_FRAME)
+            record_captions(stage, written, images=images)
+        
+        with timings.stage("graph"):
+            ffmpeg_cmd.append('-y')
+            for i, variant in enumerate(variants):
+                ffmpeg_cmd.extend(['-map', f'[out{i}]', '-map', '0:a?', *encode_args(plan)])
+                ffmpeg_cmd.extend(thread_args(plan['encode_threads']))
+                ffmpeg_cmd.append(variant['output_path'])
+        
+        print(f"Processing batch of {len(variants)} outputs from one decode")
         
         # Execute FFmpeg
-        jobs[job_id]["progress"] = 70
-        result = subprocess.run(ffmpeg_cmd, capture_output=True, text=True)
+        progress_ids = [job_id, *variant_ids]
+        with timings.stage("ffmpeg") as stage:
+            result = run_ffmpeg(ffmpeg_cmd, on_spawn, encode_progress_reporter(store, progress_ids, plan['duration']))
+            stage['cpu_seconds'] = result.cpu_seconds
         
-        if result.returncode != 0:
-            print(f"FFmpeg error: {result.stderr[-1000:]}")
-            raise Exception(f"FFmpeg failed: {result.stderr[-500:]}")
+        check_ffmpeg_result(result, store, progress_ids)
+        if plan['container'] == "fragmented":
+            with timings.stage("remux") as stage:
+                stage['cpu_seconds'] = remux_faststart(
+                    [v['output_path'] for v in variants], store, progress_ids, on_spawn
+                )
         
         # Cleanup
-        import shutil
-        shutil.rmtree(temp_dir)
-        os.remove(video_path)
+        with timings.stage("cleanup"):
+            import shutil
+            shutil.rmtree(temp_dir)
+            os.remove(video_path)
         
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["progress"] = 100
+        for variant_id in variant_ids:
+            store.update(variant_id, status="completed", progress=100, eta_seconds=0)
+        store.update(job_id, status="completed", progress=100, eta_seconds=0)
         
     except Exception as e:
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
-        print(f"Error processing video: {e}")
+        if record_failure(store, [*variant_ids, job_id], e, is_cancelled):
+            return
+        print(f"Error processing video batch: {e}")
         import traceback
         traceback.print_exc()
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import config
+
+# Bump when a renderer change makes old cached outputs stale (settings
+# that change the output are part of the key, see render_settings)
+CACHE_VERSION = 1
+
+def normalize_captions(captions):
+    """Only the parts of the caption JSON that change the rendered output"""
+    return [
+        [(w['word'].strip(), str(w['start']).strip(), str(w['end']).strip()) for w in caption.get('words', [])]
+        for caption in captions
+    ]
+
+def render_settings():
+    """Server settings that change what a render looks like"""
+    return [
+        config.OUTPUT_CONTAINER,
+        config.MAX_VIDEO_SECONDS if config.TRIM_LONG_VIDEOS else None,
+        config.CAPTION_GAP_BRIDGE_MS,
+        config.CAPTION_MIN_WORD_MS,
+    ]
+
+def render_key(video_hash, captions, template, aspect_ratio, engine):
+    """Content address of a render: same inputs and settings, same output video"""
+    payload = json.dumps(
+        [CACHE_VERSION, video_hash, normalize_captions(captions), template, aspect_ratio, engine, render_settings()],
+        separators=(',', ':'), ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def link_or_copy(src, dest):
+    """Hard-link src to dest, copying when linking is not possible"""
+    Path(dest).unlink(missing_ok=True)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+class RenderCache:
+    """Size-bounded LRU cache of finished renders, plus in-flight coalescing
+
+    Entries are files named by render key; a hit hard-links the cached file
+    to the job's output path. The directory can be shared by several server
+    processes: an entry another process added is picked up on its first
+    fetch here (each process bounds the bytes it knows of). Identical jobs
+    that arrive while the first is still encoding wait for it instead of
+    encoding again.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._bytes = 0
+        self._inflight = {}  # key -> (leader job_id, [follower job_ids])
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._load()
+
+    def _load(self):
+        files = sorted(self.cache_dir.glob("*.mp4"), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            size = path.stat().st_size
+            self._entries[path.stem] = size
+            self._bytes += size
+
+    def path(self, key):
+        return self.cache_dir / f"{key}.mp4"
+
+    def _forget(self, key):
+        self._bytes -= self._entries.pop(key, 0)
+
+    def fetch(self, key, dest):
+        """Link a cached render to dest; False on a miss"""
+        path = self.path(key)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+            except FileNotFoundError:
+                self._forget(key)
+                self.misses += 1
+                return False
+            # Also adopts entries put by another process since _load
+            self._forget(key)
+            self._entries[key] = size
+            self._bytes += size
+        try:
+            os.utime(path)
+            link_or_copy(path, dest)
+        except FileNotFoundError:
+            # Evicted by another process in the meantime
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key, output_path):
+        """Add a finished render and evict least recently used entries"""
+        # Other processes may fetch the entry at any time: only publish it whole
+        partial = self.cache_dir / f"{key}.tmp"
+        link_or_copy(output_path, partial)
+        os.replace(partial, self.path(key))
+        size = self.path(key).stat().st_size
+        with self._lock:
+            self._bytes += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, old_size = self._entries.popitem(last=False)
+                self.path(old_key).unlink(missing_ok=True)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def join(self, key, job_id, is_active=None):
+        """Register job_id for key; returns the leader's job id if one is
+        already encoding (job_id is then a follower), else None
+
+        is_active(leader_id) can reject a leader that ended without a
+        release(); job_id then takes over as leader, with its followers.
+        """
+        with self._lock:
+            if key in self._inflight:
+                leader, followers = self._inflight[key]
+                if is_active is None or is_active(leader):
+                    followers.append(job_id)
+                    self.coalesced += 1
+                    return leader
+            else:
+                followers = []
+            self._inflight[key] = (job_id, followers)
+            return None
+
+    def release(self, key):
+        """Finish an in-flight render; returns the follower job ids"""
+        with self._lock:
+            _, followers = self._inflight.pop(key, (None, []))
+            return followers
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "coalesced": self.coalesced,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "evictions": self.evictions,
+            }
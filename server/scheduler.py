@@ -0,0 +1,165 @@
+import heapq
+import itertools
+import threading
+import traceback
+
+from metrics import JOBS_FINISHED
+
+class JobScheduler:
+    """Bounded worker pool with a priority FIFO queue and cancellation
+
+    Jobs run on a fixed number of worker threads; the encode itself runs in
+    an FFmpeg child process, so threads only coordinate and rasterize.
+    Higher priority jobs run first, equal priorities run in submit order.
+    A job only runs once the job store lets this process claim it, so
+    several server processes can share one store; a job that can't be
+    claimed (cancelled or taken by another process) is passed to on_skip
+    with its task instead.
+    """
+
+    def __init__(self, store, runner, max_workers, ffmpeg_threads, owner, on_skip=None):
+        self.store = store
+        self.runner = runner
+        self.on_skip = on_skip
+        self.owner = owner
+        self.max_workers = max_workers
+        self.ffmpeg_threads = ffmpeg_threads
+        self._queue = []  # heap of (-priority, seq, job_id)
+        self._tasks = {}  # job_id -> kwargs for runner
+        self._procs = {}  # job_id -> running FFmpeg processes
+        self._running = set()
+        self._cancelled = set()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._stopping = False
+
+    def start(self):
+        """Start the worker threads"""
+        self._stopping = False
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def stop(self):
+        """Stop the workers and kill any running encodes"""
+        with self._cond:
+            self._stopping = True
+            for procs in self._procs.values():
+                for proc in procs:
+                    proc.kill()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._workers = []
+
+    def submit(self, job_id, task, priority=0):
+        """Queue a job; task holds the keyword arguments for the runner"""
+        with self._cond:
+            self._tasks[job_id] = task
+            heapq.heappush(self._queue, (-priority, next(self._seq), job_id))
+            self._cond.notify()
+
+    def queue_depth(self):
+        """Number of jobs waiting for a worker"""
+        with self._cond:
+            return len(self._tasks) - len(self._running)
+
+    def running_count(self):
+        """Number of jobs currently being processed"""
+        with self._cond:
+            return len(self._running)
+
+    def queue_position(self, job_id):
+        """1-based position of a queued job, or None if it is not waiting"""
+        with self._cond:
+            if job_id not in self._tasks or job_id in self._running:
+                return None
+            waiting = sorted(
+                entry for entry in self._queue
+                if entry[2] in self._tasks and entry[2] not in self._running
+            )
+            for position, entry in enumerate(waiting, start=1):
+                if entry[2] == job_id:
+                    return position
+            return None
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it is not active"""
+        with self._cond:
+            if job_id not in self._tasks:
+                return False
+            self._cancelled.add(job_id)
+            if job_id in self._running:
+                for proc in self._procs.get(job_id, []):
+                    proc.kill()
+            else:
+                # Queued jobs are dropped lazily when they reach the front
+                del self._tasks[job_id]
+                self._cancelled.discard(job_id)
+                self.store.update(job_id, status="cancelled")
+            return True
+
+    def is_cancelled(self, job_id):
+        with self._cond:
+            return job_id in self._cancelled
+
+    def _register_process(self, job_id, proc):
+        with self._cond:
+            self._procs.setdefault(job_id, []).append(proc)
+            if job_id in self._cancelled:
+                proc.kill()
+
+    def _next_job(self):
+        while True:
+            skipped = None
+            with self._cond:
+                while skipped is None:
+                    if self._stopping:
+                        return None, None
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    _, _, job_id = heapq.heappop(self._queue)
+                    if job_id not in self._tasks:
+                        continue
+                    if not self.store.claim(job_id, self.owner):
+                        # Cancelled elsewhere or taken by another process
+                        skipped = job_id, self._tasks.pop(job_id)
+                        continue
+                    self._running.add(job_id)
+                    return job_id, self._tasks[job_id]
+            # Outside the lock: on_skip may touch the store and the disk
+            if self.on_skip is not None:
+                try:
+                    self.on_skip(*skipped)
+                except Exception:
+                    traceback.print_exc()
+
+    def _work(self):
+        while True:
+            job_id, task = self._next_job()
+            if job_id is None:
+                return
+            try:
+                self.runner(
+                    job_id=job_id,
+                    store=self.store,
+                    ffmpeg_threads=self.ffmpeg_threads,
+                    on_spawn=lambda proc, job_id=job_id: self._register_process(job_id, proc),
+                    is_cancelled=lambda job_id=job_id: self.is_cancelled(job_id),
+                    **task
+                )
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._running.discard(job_id)
+                    self._tasks.pop(job_id, None)
+                    self._procs.pop(job_id, None)
+                    if job_id in self._cancelled:
+                        self._cancelled.discard(job_id)
+                        self.store.update(job_id, status="cancelled", error=None)
+                job = self.store.get(job_id)
+                JOBS_FINISHED.inc(status=job["status"] if job else "unknown")
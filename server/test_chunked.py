@@ -0,0 +1,48 @@
+"""Unit tests for chunk planning and windowed caption track lists
+
+    python3 -m pytest test_chunked.py
+"""
+from chunked import plan_chunks
+from processor import write_caption_track_list
+
+def read_entries(list_path):
+    """(file name, duration) pairs of an ffconcat list, without the repeated last file"""
+    lines = list_path.read_text().splitlines()[1:]
+    return [
+        (file_line.split('/')[-1].rstrip("'"), float(duration_line.split()[1]))
+        for file_line, duration_line in zip(lines[0::2], lines[1::2])
+    ]
+
+def make_track(tmp_path, events):
+    return {
+        'events': [(start, end, str(tmp_path / name)) for start, end, name in events],
+        'blank': str(tmp_path / "blank.png"),
+    }
+
+def test_plan_chunks_splits_at_keyframes():
+    keyframes = [float(t) for t in range(0, 100, 10)]
+    assert plan_chunks(100.0, keyframes, 30) == [(0.0, 30.0), (30.0, 60.0), (60.0, 100.0)]
+
+def test_plan_chunks_without_keyframes_is_one_piece():
+    assert plan_chunks(75.0, [], 30) == [(0.0, 75.0)]
+
+def test_track_list_whole_track(tmp_path):
+    track = make_track(tmp_path, [(1.0, 2.0, "a.png"), (2.0, 3.5, "b.png")])
+    write_caption_track_list(track, tmp_path / "list.ffconcat")
+    assert read_entries(tmp_path / "list.ffconcat") == [
+        ("blank.png", 1.0), ("a.png", 1.0), ("b.png", 1.5), ("blank.png", 0.04),
+    ]
+
+def test_track_list_window_stops_at_window_end(tmp_path):
+    track = make_track(tmp_path, [(28.0, 29.0, "a.png"), (35.0, 36.0, "b.png")])
+    write_caption_track_list(track, tmp_path / "list.ffconcat", 0.0, 30.0)
+    entries = read_entries(tmp_path / "list.ffconcat")
+    assert entries == [("blank.png", 28.0), ("a.png", 1.0), ("blank.png", 0.04)]
+    assert all(duration > 0 for _, duration in entries)
+
+def test_track_list_window_clips_both_ends(tmp_path):
+    track = make_track(tmp_path, [(29.0, 31.0, "a.png"), (40.0, 65.0, "b.png"), (70.0, 71.0, "c.png")])
+    write_caption_track_list(track, tmp_path / "list.ffconcat", 30.0, 60.0)
+    assert read_entries(tmp_path / "list.ffconcat") == [
+        ("a.png", 1.0), ("blank.png", 9.0), ("b.png", 20.0), ("blank.png", 0.04),
+    ]
@@ -0,0 +1,85 @@
+"""Unit tests for download Range and conditional request handling
+
+    python3 -m pytest test_downloads.py
+"""
+import asyncio
+import os
+
+import pytest
+from fastapi import Request
+
+from downloads import WholeFileResponse, if_range_matches, parse_byte_range, read_file_range
+
+def make_request(**headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/download/job",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+def send_response(response, request):
+    """(status, body) the response sends for request"""
+    messages = []
+
+    async def receive():
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(response(request.scope, receive, send))
+    body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+    return messages[0]["status"], body
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(bytes(range(10)))
+    return path
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-3", (0, 3)),
+    ("bytes=4-", (4, 9)),
+    ("bytes=-3", (7, 9)),
+    ("bytes=-50", (0, 9)),
+    ("bytes=5-500", (5, 9)),
+    (" bytes = 2 - 2 ", (2, 2)),
+])
+def test_parse_byte_range(header, expected):
+    assert parse_byte_range(header, 10) == expected
+
+@pytest.mark.parametrize("header", ["bytes=5-2", "bytes=0-1,5-6", "bytes=-", "items=0-1", "bytes=a-b"])
+def test_parse_byte_range_ignores_unsupported_ranges(header):
+    assert parse_byte_range(header, 10) is None
+
+@pytest.mark.parametrize("header, size", [("bytes=10-", 10), ("bytes=20-30", 10), ("bytes=-0", 10), ("bytes=-5", 0)])
+def test_parse_byte_range_rejects_unsatisfiable_ranges(header, size):
+    with pytest.raises(ValueError):
+        parse_byte_range(header, size)
+
+def test_if_range_matches(video):
+    response = WholeFileResponse(video, stat_result=os.stat(video))
+    etag = response.headers["etag"]
+    last_modified = response.headers["last-modified"]
+    assert if_range_matches(make_request(), response)
+    assert if_range_matches(make_request(if_range=etag), response)
+    assert if_range_matches(make_request(if_range=last_modified), response)
+    assert not if_range_matches(make_request(if_range='"stale"'), response)
+    assert not if_range_matches(make_request(if_range=f"W/{etag}"), response)
+    assert not if_range_matches(make_request(if_range="Thu, 01 Jan 1970 00:00:00 GMT"), response)
+    assert not if_range_matches(make_request(if_range="not a date"), response)
+
+def test_read_file_range(video):
+    async def read(first, last):
+        return b"".join([chunk async for chunk in read_file_range(video, first, last, 3)])
+
+    assert asyncio.run(read(2, 8)) == bytes(range(2, 9))
+    assert asyncio.run(read(9, 20)) == bytes([9])
+
+@pytest.mark.parametrize("headers", [{"range": "bytes=0-1,5-6"}, {"range": "bytes=5-2"}, {"range": "bytes=0-3", "if_range": '"stale"'}])
+def test_whole_file_response_ignores_range(video, headers):
+    status, body = send_response(WholeFileResponse(video, stat_result=os.stat(video)), make_request(**headers))
+    assert status == 200
+    assert body == video.read_bytes()
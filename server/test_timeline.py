@@ -0,0 +1,90 @@
+"""Unit tests for caption timeline compilation
+
+    python3 -m pytest test_timeline.py
+"""
+import pytest
+
+from timeline import compile_timeline, parse_time_to_seconds
+
+def word(text, start, end):
+    return {"word": text, "start": start, "end": end}
+
+def events(timeline):
+    return [(round(start, 3), round(end, 3), seg, idx) for start, end, seg, idx in timeline.events()]
+
+def compile_words(*segments, gap_bridge=0.5, min_duration=0.04):
+    return compile_timeline([{"words": list(words)} for words in segments], gap_bridge, min_duration)
+
+def test_sequential_words():
+    timeline = compile_words([word("a", "00:00:000", "00:01:000"), word("b", "00:01:000", "00:02:000")])
+    assert events(timeline) == [(0.0, 1.0, 0, 0), (1.0, 2.0, 0, 1)]
+
+def test_contained_window_clips_the_outer_one():
+    timeline = compile_words(
+        [word("a", "00:00:000", "00:10:000")],
+        [word("b", "00:02:000", "00:03:000")],
+    )
+    assert events(timeline) == [(0.0, 2.0, 0, 0), (2.0, 3.0, 1, 0)]
+
+def test_overlap_clip_below_min_duration_drops_the_word():
+    timeline = compile_words([word("a", "00:00:000", "00:01:000"), word("b", "00:00:020", "00:02:000")])
+    assert events(timeline) == [(0.02, 2.0, 0, 1)]
+
+def test_equal_starts_across_segments_keep_the_later_segment():
+    timeline = compile_words(
+        [word("a", "00:05:000", "00:06:000")],
+        [word("b", "00:05:000", "00:07:000")],
+    )
+    assert events(timeline) == [(5.0, 7.0, 1, 0)]
+
+def test_short_words_get_no_window_but_stay_in_the_segment():
+    timeline = compile_words([word("a", "00:00:000", "00:00:010"), word("b", "00:00:500", "00:01:000")])
+    assert events(timeline) == [(0.5, 1.0, 0, 1)]
+    assert [w["word"] for w in timeline.segments[0]] == ["a", "b"]
+
+def test_blank_words_are_dropped():
+    timeline = compile_words([word(" ", "00:00:000", "00:01:000"), word("b", "00:01:000", "00:02:000")])
+    assert events(timeline) == [(1.0, 2.0, 0, 0)]
+    assert [w["word"] for w in timeline.segments[0]] == ["b"]
+
+def test_gaps_are_bridged_across_segment_boundaries():
+    timeline = compile_words(
+        [word("a", "00:00:000", "00:01:000")],
+        [word("b", "00:01:300", "00:02:000")],
+        [word("c", "00:03:000", "00:04:000")],
+    )
+    # 0.3 s is bridged by holding "a"; 1 s is longer than the bridge
+    assert events(timeline) == [(0.0, 1.3, 0, 0), (1.3, 2.0, 1, 0), (3.0, 4.0, 2, 0)]
+
+def test_at_uses_half_open_windows():
+    timeline = compile_words(
+        [word("a", "00:01:000", "00:02:000"), word("b", "00:02:000", "00:03:000")],
+        gap_bridge=0,
+    )
+    assert timeline.at(0.999) is None
+    assert timeline.at(1.0) == (0, 0)
+    assert timeline.at(1.999) == (0, 0)
+    assert timeline.at(2.0) == (0, 1)
+    assert timeline.at(3.0) is None
+
+def test_parse_time_to_seconds():
+    assert parse_time_to_seconds("01:02:345") == 62.345
+
+@pytest.mark.parametrize("value", ["1:2", "00:60:000", "00:00:1000", "aa:00:000", "", None])
+def test_parse_time_rejects_malformed_times(value):
+    with pytest.raises(ValueError, match="expected MM:SS:mmm"):
+        parse_time_to_seconds(value)
+
+@pytest.mark.parametrize("captions, message", [
+    ({"words": []}, "Captions must be a list"),
+    (["text"], "Caption 0: expected an object with a 'words' list"),
+    ([{"words": "a b"}], "Caption 0: expected an object with a 'words' list"),
+    ([{"words": [{"word": 1, "start": "00:00:000", "end": "00:01:000"}]}], "Caption 0 word 0: expected an object"),
+    ([{"words": [{"word": "a", "start": "00:00:000"}]}], "Caption 0 word 0: missing 'end'"),
+    ([{"words": [word("a", "00:00:000", "00:01:000"), word("b", "0:1", "00:02:000")]}],
+     "Caption 0 word 1: Invalid caption time '0:1'"),
+])
+def test_malformed_captions_raise_value_error(captions, message):
+    with pytest.raises(ValueError) as error:
+        compile_timeline(captions)
+    assert str(error.value).startswith(message)
@@ -0,0 +1,102 @@
+from array import array
+from bisect import bisect_right
+
+import config
+
+def parse_time_to_seconds(time_str):
+    """Convert MM:SS:mmm to seconds; raises ValueError on anything else"""
+    parts = str(time_str).strip().split(':')
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        raise ValueError(f"Invalid caption time {time_str!r} (expected MM:SS:mmm)")
+    minutes, seconds, milliseconds = (int(part) for part in parts)
+    if seconds >= 60 or milliseconds >= 1000:
+        raise ValueError(f"Invalid caption time {time_str!r} (expected MM:SS:mmm)")
+    return minutes * 60 + seconds + milliseconds / 1000.0
+
+class Timeline:
+    """Compiled captions: segments plus sorted, non-overlapping word windows
+
+    segments holds each caption's words (cleaned, in order). Event i shows
+    word word_idx[i] of segment seg_idx[i] highlighted from starts[i] to
+    ends[i]; the four columns are flat arrays sorted by start time.
+    """
+
+    def __init__(self, segments, events):
+        self.segments = segments
+        self.starts = array('d', (e[0] for e in events))
+        self.ends = array('d', (e[1] for e in events))
+        self.seg_idx = array('I', (e[2] for e in events))
+        self.word_idx = array('I', (e[3] for e in events))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def events(self):
+        """(start, end, segment index, word index) in time order"""
+        return zip(self.starts, self.ends, self.seg_idx, self.word_idx)
+
+    def at(self, t):
+        """(segment index, word index) visible at t, or None"""
+        i = bisect_right(self.starts, t) - 1
+        if i >= 0 and t < self.ends[i]:
+            return self.seg_idx[i], self.word_idx[i]
+        return None
+
+def compile_timeline(captions, gap_bridge=None, min_duration=None):
+    """Validate caption JSON and normalize it into a Timeline
+
+    Malformed captions raise ValueError. Words shorter than min_duration get
+    no window of their own (they still show in their segment), overlapping
+    windows are clipped at the next word's start, and gaps up to gap_bridge
+    are closed by holding the previous word so captions don't flicker off.
+    """
+    if gap_bridge is None:
+        gap_bridge = config.CAPTION_GAP_BRIDGE_MS / 1000
+    if min_duration is None:
+        min_duration = config.CAPTION_MIN_WORD_MS / 1000
+    if not isinstance(captions, list):
+        raise ValueError("Captions must be a list")
+
+    segments = []
+    events = []
+    for caption_idx, caption in enumerate(captions):
+        if not isinstance(caption, dict) or not isinstance(caption.get('words', []), list):
+            raise ValueError(f"Caption {caption_idx}: expected an object with a 'words' list")
+
+        words = []
+        for word_idx, word_data in enumerate(caption.get('words', [])):
+            where = f"Caption {caption_idx} word {word_idx}"
+            if not isinstance(word_data, dict) or not isinstance(word_data.get('word'), str):
+                raise ValueError(f"{where}: expected an object with 'word', 'start' and 'end'")
+            try:
+                start = parse_time_to_seconds(word_data['start'])
+                end = parse_time_to_seconds(word_data['end'])
+            except KeyError as e:
+                raise ValueError(f"{where}: missing {e.args[0]!r}")
+            except ValueError as e:
+                raise ValueError(f"{where}: {e}")
+
+            text = word_data['word'].strip()
+            if not text:
+                continue
+            if end - start >= min_duration:
+                events.append([start, end, len(segments), len(words)])
+            words.append({**word_data, 'word': text})
+
+        if words:
+            segments.append(words)
+
+    events.sort(key=lambda e: (e[0], e[2], e[3]))
+
+    cleaned = []
+    for event in events:
+        if cleaned and cleaned[-1][1] > event[0]:
+            # Overlap: the earlier word gives way to the later one
+            cleaned[-1][1] = event[0]
+            if cleaned[-1][1] - cleaned[-1][0] < min_duration:
+                cleaned.pop()
+        if cleaned and 0 < event[0] - cleaned[-1][1] <= gap_bridge:
+            cleaned[-1][1] = event[0]
+        cleaned.append(event)
+
+    return Timeline(segments, cleaned)
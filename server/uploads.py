@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import os
+import threading
+import uuid
+from pathlib import Path
+
+from fastapi.responses import JSONResponse
+
+class UploadError(Exception):
+    """Upload rejected; status_code is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def hash_file(path, chunk_size):
+    """SHA-256 of a file, read in fixed-size chunks"""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher
+
+async def save_upload_stream(upload, dest, max_bytes, chunk_size):
+    """Stream an UploadFile to dest in chunks, hashing on the fly
+
+    Returns (size, sha256 hex). Memory use is one chunk regardless of the
+    file size; the partial file is removed if the upload is too large.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(dest, "wb") as f:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadError(f"Video is larger than {max_bytes // (1024 * 1024)} MB", 413)
+                hasher.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        Path(dest).unlink(missing_ok=True)
+        raise
+    return size, hasher.hexdigest()
+
+class UploadSizeLimit:
+    """ASGI middleware refusing form uploads whose Content-Length is over the limit
+
+    Starlette spools a whole multipart body to a temp file before the
+    handler runs, so save_upload_stream's check comes after the disk was
+    used. overhead_bytes allows for the other form fields. Bodies sent
+    without a Content-Length are still only checked there; resumable
+    uploads are checked chunk by chunk.
+    """
+
+    def __init__(self, app, paths, max_bytes, overhead_bytes=0):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.overhead_bytes = overhead_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] == "POST" and scope["path"] in self.paths:
+            length = dict(scope["headers"]).get(b"content-length", b"")
+            if length.isdigit() and int(length) > self.max_bytes + self.overhead_bytes:
+                response = JSONResponse(
+                    {"error": f"Video is larger than {self.max_bytes // (1024 * 1024)} MB"}, status_code=413
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+class ResumableUploads:
+    """Chunked uploads that can be resumed from the last received byte
+
+    Each session is a .part file in upload_dir; its size is the resume
+    offset, so sessions survive a server restart (the running hash is
+    rebuilt from the file when it is not in memory).
+    """
+
+    def __init__(self, upload_dir, max_bytes, chunk_size):
+        self.upload_dir = Path(upload_dir)
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self._hashers = {}  # upload_id -> (offset, sha256 state)
+        self._active = set()  # sessions with a chunk in flight
+        self._lock = threading.Lock()
+
+    def part_path(self, upload_id):
+        # upload ids are generated by create(); reject anything else
+        return self.upload_dir / f"{uuid.UUID(upload_id)}.part"
+
+    def create(self, total_size=None):
+        """Start a session; returns its id"""
+        if total_size is not None and total_size > self.max_bytes:
+            raise UploadError(f"Video is larger than {self.max_bytes // (1024 * 1024)} MB", 413)
+        upload_id = str(uuid.uuid4())
+        self.part_path(upload_id).touch()
+        return upload_id
+
+    def offset(self, upload_id):
+        """Bytes received so far, or None for an unknown session"""
+        try:
+            return self.part_path(upload_id).stat().st_size
+        except (ValueError, FileNotFoundError):
+            return None
+
+    async def _hasher(self, upload_id, offset, cached):
+        """Running hash at offset: the cached one, or rebuilt from the .part file on a thread"""
+        if cached and cached[0] == offset:
+            return cached[1]
+        return await asyncio.to_thread(hash_file, self.part_path(upload_id), self.chunk_size)
+
+    async def append(self, upload_id, offset, stream):
+        """Append a chunk received at offset from an async byte stream"""
+        current = self.offset(upload_id)
+        if current is None:
+            raise UploadError("Upload not found", 404)
+        if offset != current:
+            raise UploadError(f"Offset mismatch: expected {current}", 409)
+
+        with self._lock:
+            if upload_id in self._active:
+                raise UploadError("Another chunk is being uploaded", 409)
+            self._active.add(upload_id)
+            cached = self._hashers.get(upload_id)
+        try:
+            hasher = await self._hasher(upload_id, current, cached)
+            size = current
+            with open(self.part_path(upload_id), "ab") as f:
+                try:
+                    async for chunk in stream:
+                        if not chunk:
+                            continue
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise UploadError(f"Video is larger than {self.max_bytes // (1024 * 1024)} MB", 413)
+                        hasher.update(chunk)
+                        f.write(chunk)
+                except BaseException:
+                    # Drop the partial chunk; the client retries from the old offset
+                    f.truncate(current)
+                    with self._lock:
+                        self._hashers.pop(upload_id, None)
+                    raise
+            with self._lock:
+                self._hashers[upload_id] = (size, hasher)
+            return size
+        finally:
+            with self._lock:
+                self._active.discard(upload_id)
+
+    async def finish(self, upload_id, dest):
+        """Move a finished session to dest; returns (size, sha256 hex)"""
+        size = self.offset(upload_id)
+        if size is None:
+            raise UploadError("Upload not found", 404)
+        with self._lock:
+            cached = self._hashers.pop(upload_id, None)
+        hasher = await self._hasher(upload_id, size, cached)
+        os.replace(self.part_path(upload_id), dest)
+        return size, hasher.hexdigest()